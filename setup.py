@@ -88,11 +88,15 @@ setup(name='udunitspy',
     cmdclass=cmdclass,
     ext_modules = [udunits_module],
     classifiers=classifiers.split('\n'),
-    packages=['udunitspy', 'udunitspy.test'],
+    packages=['udunitspy', 'udunitspy.test', 'udunitspy.benchmarks'],
     use_2to3=True,
     data_files=[('etc/udunits', xml_files),],
+    entry_points={
+        'console_scripts': [
+            'udunits-convert = udunitspy.convert:main',
+        ],
+    },
     install_requires = [
-        'numexpr==2.1',
         'pytest==2.3.2',
         'pytest-cov==1.6',
     ],
@@ -1,2 +1,4 @@
 from udunits2 import Unit, System, Converter, UdunitsError
+from convert import convert_file
+from instrumentation import stats
 __version__ = '0.0.6'
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+"""
+@package udunitspy.aio
+@file udunitspy/aio.py
+@author Christopher Mueller
+@brief asyncio front end: unit work offloaded to a bounded thread pool
+
+Loading a System, parsing units, building converters and converting large
+arrays block the calling thread.  The coroutines here run that work on a
+small shared ThreadPoolExecutor instead, so the event loop stays free; the
+udunits calls doing the heavy lifting release the GIL while they run (see
+the Threads section of the README).
+
+Large arrays are converted CHUNK_SIZE elements at a time, one chunk in the
+executor per call, so a big conversion takes its turn with the work of
+other requests rather than holding every worker until it is done.
+
+Python 3.5+ only; udunitspy/__init__.py does not import it.
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import threading
+import numpy as np
+from udunitspy.udunits2 import System, Unit, Converter, UNIT_CACHE_SIZE, _result_dtype, _squeeze
+
+# Threads in the shared executor
+MAX_WORKERS = 4
+
+# Elements converted per executor job
+CHUNK_SIZE = 1 << 18
+
+# Arrays up to this size are converted on the event loop thread; handing
+# them to the executor would cost more than the conversion
+INLINE_THRESHOLD = 1 << 12
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    """The executor shared by the coroutines of this module, built on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(MAX_WORKERS)
+
+        return _executor
+
+def _run(executor, func, *args, **kwargs):
+    loop = asyncio.get_event_loop()
+    return loop.run_in_executor(executor or get_executor(), functools.partial(func, *args, **kwargs))
+
+async def load_system(path=None, empty=False, cache_size=UNIT_CACHE_SIZE, snapshot=None, executor=None):
+    """System(path, empty, cache_size, snapshot) built on the executor."""
+    return await _run(executor, System, path=path, empty=empty, cache_size=cache_size, snapshot=snapshot)
+
+def _get_converter(unit_1, unit_2, system):
+    if not isinstance(unit_1, Unit):
+        unit_1 = Unit(unit_1, system=system)
+
+    return unit_1.get_converter(unit_2)
+
+async def get_converter(unit_1, unit_2, system=None, executor=None):
+    """Unit(unit_1, system).get_converter(unit_2) run on the executor.
+
+    Like Unit.get_converter, returns None if the units are not convertible.
+    """
+    return await _run(executor, _get_converter, unit_1, unit_2, system)
+
+def _convert_block(converter, value, result, block):
+    # Elements 'block' (a slice) of the flattened arrays: views of them when
+    # both are C-contiguous, copies of just the block otherwise
+    if value.flags.c_contiguous and result.flags.c_contiguous:
+        converter._convert(value.reshape(-1)[block], result.reshape(-1)[block])
+    else:
+        result.flat[block] = converter._convert(value.flat[block])
+
+async def convert(converter, value, out=None, chunk_size=CHUNK_SIZE, executor=None):
+    """Converter.evaluate(value, out) with large arrays converted on the
+    executor 'chunk_size' elements at a time (whatever their shape and
+    memory layout), yielding to the event loop while each chunk is
+    converted.
+    """
+    if not isinstance(converter, Converter):
+        raise TypeError('\'converter\' must be of type Converter. Got: {0}'.format(converter))
+    if isinstance(value, (int, float)) or np.size(value) <= INLINE_THRESHOLD:
+        return converter.evaluate(value, out)
+
+    value = np.asarray(value)
+    result = out
+    if result is None:
+        result = np.empty(value.shape, dtype=_result_dtype(value))
+    elif not isinstance(result, np.ndarray) or result.shape != value.shape:
+        raise ValueError('\'out\' must be an array of shape {0}'.format(value.shape))
+
+    chunk_size = max(1, int(chunk_size))
+    for start in range(0, value.size, chunk_size):
+        await _run(executor, _convert_block, converter, value, result, slice(start, start + chunk_size))
+
+    if out is not None:
+        return out
+
+    return _squeeze(result)
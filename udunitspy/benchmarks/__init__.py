@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+"""
+@package udunitspy.benchmarks
+@file udunitspy/benchmarks/__init__.py
+@author Christopher Mueller
+@brief Performance benchmarks for udunitspy
+
+Usage:
+    python -m udunitspy.benchmarks [-h] [-k PATTERN] [--rounds ROUNDS] [--max-elements N]
+                                   [--json PATH] [--compare BASELINE] [--threshold T] [--list]
+"""
+
+import argparse
+import sys
+from udunitspy.benchmarks.harness import BENCHMARKS, THRESHOLD, benchmark, run, compare, format_comparison, save, load
+# Importing the suites registers their benchmarks
+from udunitspy.benchmarks import bench_udunits2, bench_netcdftime
+
+# Largest per-call element count run by default; pass --max-elements to go up to 10^8
+MAX_ELEMENTS = 10**6
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the udunitspy benchmarks')
+    parser.add_argument('-k', dest='pattern', default=None, help='only run benchmarks matching this regular expression')
+    parser.add_argument('--rounds', type=int, default=5, help='timed rounds per benchmark (default: %(default)s)')
+    parser.add_argument('--max-elements', type=int, default=MAX_ELEMENTS,
+                        help='skip array benchmarks larger than this (default: %(default)s)')
+    parser.add_argument('--json', default=None, help='write the results to this JSON file')
+    parser.add_argument('--compare', default=None, help='compare against the results in this JSON file')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='slowdown counted as a regression when comparing (default: %(default)s)')
+    parser.add_argument('--list', action='store_true', help='list the benchmarks and exit')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name in BENCHMARKS:
+            print(name)
+        return 0
+
+    def log(line):
+        print(line)
+        sys.stdout.flush()
+
+    results = run(args.pattern, rounds=args.rounds, max_elements=args.max_elements, log=log)
+    if args.json:
+        save(results, args.json)
+
+    if args.compare:
+        rows = compare(results, load(args.compare), args.threshold, args.pattern, args.max_elements)
+        print('')
+        print(format_comparison(rows))
+        if any(row[4] == 'regression' for row in rows):
+            return 1
+
+    return 0
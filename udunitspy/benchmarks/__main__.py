@@ -0,0 +1,13 @@
+#!/usr/bin/env python
+
+"""
+@package udunitspy.benchmarks
+@file udunitspy/benchmarks/__main__.py
+@author Christopher Mueller
+@brief Entry point for python -m udunitspy.benchmarks
+"""
+
+import sys
+from udunitspy.benchmarks import main
+
+sys.exit(main())
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+"""
+@package udunitspy.benchmarks.bench_netcdftime
+@file udunitspy/benchmarks/bench_netcdftime.py
+@author Christopher Mueller
+@brief Benchmarks for netcdftime date2num, num2date and date2index
+"""
+
+from udunitspy.benchmarks.harness import benchmark
+from udunitspy import netcdftime
+import numpy as np
+
+UNITS = 'hours since 1900-01-01 00:00:00'
+
+# Element counts for the benchmarks creating one python object per date
+OBJECT_SIZES = [10**k for k in range(1, 6)]
+# ... and for the vectorized ones
+SIZES = [10**k for k in range(1, 9)]
+
+# Length of the time axis searched by date2index
+AXIS_LENGTH = 10**7
+
+def _hours(size):
+    return np.arange(size, dtype='d') * 1.5
+
+@benchmark('date2num', params=OBJECT_SIZES)
+def bench_date2num(size):
+    dates = netcdftime.num2date(_hours(size), UNITS)
+    return lambda: netcdftime.date2num(dates, UNITS)
+
+@benchmark('date2num_datetime64', params=SIZES)
+def bench_date2num_datetime64(size):
+    dates = np.datetime64('1900-01-01') + (_hours(size) * 3600).astype('m8[s]')
+    return lambda: netcdftime.date2num(dates, UNITS)
+
+@benchmark('num2date', params=OBJECT_SIZES)
+def bench_num2date(size):
+    values = _hours(size)
+    return lambda: netcdftime.num2date(values, UNITS)
+
+@benchmark('num2date_360_day', params=OBJECT_SIZES)
+def bench_num2date_360_day(size):
+    values = _hours(size)
+    return lambda: netcdftime.num2date(values, UNITS, '360_day')
+
+@benchmark('num2date_datetime64', params=SIZES)
+def bench_num2date_datetime64(size):
+    values = _hours(size)
+    return lambda: netcdftime.num2date(values, UNITS, as_datetime64=True)
+
+class _TimeVariable(np.ndarray):
+    pass
+
+def _time_axis():
+    nctime = np.arange(AXIS_LENGTH, dtype='d').view(_TimeVariable)
+    nctime.units = UNITS
+    nctime.calendar = 'standard'
+    return nctime
+
+@benchmark('date2index', params=OBJECT_SIZES[:4])
+def bench_date2index(size):
+    nctime = _time_axis()
+    dates = netcdftime.num2date(np.linspace(0, AXIS_LENGTH - 1, size).round() + 0.25, UNITS)
+    return lambda: netcdftime.date2index(dates, nctime, select='nearest')
+
+@benchmark('time_index', params=OBJECT_SIZES[:4])
+def bench_time_index(size):
+    index = netcdftime.TimeIndex(_time_axis())
+    dates = netcdftime.num2date(np.linspace(0, AXIS_LENGTH - 1, size).round() + 0.25, UNITS)
+    return lambda: index.date2index(dates, select='nearest')
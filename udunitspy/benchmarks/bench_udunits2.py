@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+"""
+@package udunitspy.benchmarks.bench_udunits2
+@file udunitspy/benchmarks/bench_udunits2.py
+@author Christopher Mueller
+@brief Benchmarks for unit parsing, system startup and conversion
+"""
+
+from udunitspy.benchmarks.harness import benchmark
+import numpy as np
+
+# Element counts for the array benchmarks
+SIZES = [10**k for k in range(1, 9)]
+
+@benchmark('system_startup')
+def bench_system_startup():
+    from udunitspy.udunits2 import System, DEFAULT_UDUNITS_PATH
+    return lambda: System(path=DEFAULT_UDUNITS_PATH)
+
+@benchmark('unit_parse')
+def bench_unit_parse():
+    # Through the System's unit cache, as Unit(...) is normally used
+    from udunitspy.udunits2 import Unit, get_default_system
+    get_default_system()
+    return lambda: Unit('kg m-2 s-1')
+
+@benchmark('ut_parse')
+def bench_ut_parse():
+    # The C parser alone
+    from udunitspy.udunits2 import ut, get_default_system, UT_ASCII
+    system = get_default_system().this
+    return lambda: ut.parse(system, 'kg m-2 s-1', UT_ASCII)
+
+@benchmark('get_converter')
+def bench_get_converter():
+    from udunitspy.udunits2 import Unit
+    m = Unit('m')
+    return lambda: m.get_converter('ft')
+
+@benchmark('converter_construction')
+def bench_converter_construction():
+    from udunitspy.udunits2 import Unit, Converter
+    m, ft = Unit('m'), Unit('ft')
+    return lambda: Converter(m, ft)
+
+@benchmark('convert_scalar')
+def bench_convert_scalar():
+    from udunitspy.udunits2 import Converter
+    conv = Converter('degC', 'degF')
+    return lambda: conv(21.5)
+
+@benchmark('convert_array', params=SIZES)
+def bench_convert_array(size):
+    from udunitspy.udunits2 import Converter
+    conv = Converter('degC', 'degF')
+    values = np.random.RandomState(0).uniform(-50, 50, size)
+    return lambda: conv(values)
+
+@benchmark('convert_array_inplace', params=SIZES)
+def bench_convert_array_inplace(size):
+    from udunitspy.udunits2 import Converter
+    conv = Converter('degC', 'degF')
+    values = np.random.RandomState(0).uniform(-50, 50, size)
+    out = np.empty_like(values)
+    return lambda: conv(values, out=out)
+
+@benchmark('convert_array_log', params=SIZES[:6])
+def bench_convert_array_log(size):
+    from udunitspy.udunits2 import Converter
+    conv = Converter(base=10)
+    values = np.random.RandomState(0).uniform(1, 1000, size)
+    return lambda: conv(values)
+
+@benchmark('combine')
+def bench_combine():
+    from udunitspy.udunits2 import Converter
+    s2min, min2hr = Converter('s', 'min'), Converter('min', 'hr')
+    return lambda: s2min.combine(min2hr)
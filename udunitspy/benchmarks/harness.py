@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+
+"""
+@package udunitspy.benchmarks.harness
+@file udunitspy/benchmarks/harness.py
+@author Christopher Mueller
+@brief Minimal stdlib benchmark harness: registry, timing, JSON results and baseline comparison
+"""
+
+from collections import OrderedDict
+import datetime
+import json
+import math
+import platform
+import re
+import timeit
+
+# Registered benchmarks: name -> (factory, elements).  A factory does any
+# setup and returns the callable to time.
+BENCHMARKS = OrderedDict()
+
+# Minimum wall time of one round; the callable is repeated until it is reached
+MIN_ROUND_TIME = 0.05
+
+# A benchmark is a regression when its best time exceeds the baseline's by more than this
+THRESHOLD = 0.10
+
+def benchmark(name, params=None):
+    """Register the decorated factory as benchmark 'name'.
+
+    With 'params', one benchmark '<name>[<param>]' is registered per value and
+    the factory is called with it; integer params are reported as the number
+    of elements processed per call.
+    """
+    def register(factory):
+        if params is None:
+            BENCHMARKS[name] = (factory, None)
+        else:
+            for param in params:
+                elements = param if isinstance(param, (int, long)) else None
+                BENCHMARKS['{0}[{1}]'.format(name, param)] = (_bind(factory, param), elements)
+
+        return factory
+
+    return register
+
+def _bind(factory, param):
+    return lambda: factory(param)
+
+def _calibrate(func, timer):
+    # Smallest power of 10 number of loops taking at least MIN_ROUND_TIME
+    number = 1
+    while True:
+        start = timer()
+        for _ in xrange(number):
+            func()
+        elapsed = timer() - start
+        if elapsed >= MIN_ROUND_TIME or number >= 10**9:
+            return number, elapsed
+        number *= 10
+
+def time_callable(func, rounds=5, timer=timeit.default_timer):
+    """Time 'func' over 'rounds' rounds of an automatically chosen number of
+    calls.  Returns a dict of per-call statistics in seconds.
+    """
+    number, _ = _calibrate(func, timer)
+    times = []
+    for _ in xrange(rounds):
+        start = timer()
+        for _ in xrange(number):
+            func()
+        times.append((timer() - start) / number)
+
+    times.sort()
+    mean = sum(times) / len(times)
+    return {
+        'min': times[0],
+        'max': times[-1],
+        'mean': mean,
+        'median': times[len(times) // 2] if len(times) % 2 else (times[len(times) // 2 - 1] + times[len(times) // 2]) / 2,
+        'stddev': math.sqrt(sum((t - mean) ** 2 for t in times) / len(times)),
+        'rounds': rounds,
+        'loops': number,
+    }
+
+def machine_info():
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+    }
+
+def run(pattern=None, rounds=5, max_elements=None, benchmarks=None, log=None):
+    """Run the registered benchmarks whose names match the regular expression
+    'pattern' (all of them by default), skipping those processing more than
+    'max_elements' elements per call.  Returns the results dict that is
+    written as JSON.
+    """
+    benchmarks = BENCHMARKS if benchmarks is None else benchmarks
+    results = OrderedDict()
+    for name, (factory, elements) in benchmarks.items():
+        if not selected(name, elements, pattern, max_elements):
+            continue
+
+        stats = time_callable(factory(), rounds=rounds)
+        if elements is not None:
+            stats['elements'] = elements
+            stats['elements_per_second'] = elements / stats['min'] if stats['min'] > 0 else None
+        results[name] = stats
+        if log is not None:
+            log(format_result(name, stats))
+
+    return {
+        'machine': machine_info(),
+        'timestamp': datetime.datetime.utcnow().isoformat(),
+        'benchmarks': results,
+    }
+
+def selected(name, elements, pattern=None, max_elements=None):
+    """Whether run() runs benchmark 'name' for these 'pattern' and 'max_elements'."""
+    if pattern and not re.search(pattern, name):
+        return False
+
+    return max_elements is None or elements is None or elements <= max_elements
+
+def format_result(name, stats):
+    return '{0:<40} {1:>12} {2:>12}'.format(name, _format_time(stats['min']), _format_time(stats['median']))
+
+def _format_time(seconds):
+    for unit, scale in (('s', 1.), ('ms', 1e3), ('us', 1e6)):
+        if seconds * scale >= 1:
+            return '{0:.3f} {1}'.format(seconds * scale, unit)
+
+    return '{0:.1f} ns'.format(seconds * 1e9)
+
+def compare(results, baseline, threshold=THRESHOLD, pattern=None, max_elements=None):
+    """Compare the best times of 'results' against 'baseline' (both results
+    dicts as returned by run()).  Returns a list of
+    (name, baseline_min, min, ratio, status) rows, status being one of
+    'regression', 'improvement', 'ok', 'new' or 'missing'.  Baseline
+    benchmarks that the 'pattern' and 'max_elements' given to run() would
+    have skipped are left out.
+    """
+    current = results['benchmarks']
+    previous = OrderedDict((name, stats) for name, stats in baseline['benchmarks'].items()
+                           if selected(name, stats.get('elements'), pattern, max_elements))
+    rows = []
+    for name in list(current) + [name for name in previous if name not in current]:
+        if name not in previous:
+            rows.append((name, None, current[name]['min'], None, 'new'))
+            continue
+        if name not in current:
+            rows.append((name, previous[name]['min'], None, None, 'missing'))
+            continue
+
+        before, after = previous[name]['min'], current[name]['min']
+        ratio = after / before if before > 0 else float('inf')
+        if ratio > 1 + threshold:
+            status = 'regression'
+        elif ratio < 1 - threshold:
+            status = 'improvement'
+        else:
+            status = 'ok'
+        rows.append((name, before, after, ratio, status))
+
+    return rows
+
+def format_comparison(rows):
+    lines = ['{0:<40} {1:>12} {2:>12} {3:>8}  {4}'.format('benchmark', 'baseline', 'current', 'ratio', 'status')]
+    for name, before, after, ratio, status in rows:
+        lines.append('{0:<40} {1:>12} {2:>12} {3:>8}  {4}'.format(
+            name,
+            _format_time(before) if before is not None else '-',
+            _format_time(after) if after is not None else '-',
+            '{0:.2f}x'.format(ratio) if ratio is not None else '-',
+            status))
+
+    return '\n'.join(lines)
+
+def save(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+def load(path):
+    with open(path) as f:
+        return json.load(f, object_pairs_hook=OrderedDict)
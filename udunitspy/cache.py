@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+"""
+@package udunitspy.cache
+@file udunitspy/cache.py
+@author Christopher Mueller
+@brief Bounded, thread-safe LRU cache with hit/miss/eviction counters
+"""
+
+from collections import OrderedDict
+import threading
+
+class LRUCache(object):
+    """Least-recently-used mapping holding at most 'capacity' entries.
+
+    All operations take an internal lock, so a single instance can be shared
+    between threads.  A capacity of 0 disables caching altogether.
+    """
+
+    def __init__(self, capacity=128):
+        self._lock = threading.RLock()
+        self._data = OrderedDict()
+        self._capacity = int(capacity)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @capacity.setter
+    def capacity(self, capacity):
+        with self._lock:
+            self._capacity = int(capacity)
+            self._evict()
+
+    def _evict(self):
+        while len(self._data) > max(self._capacity, 0):
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            # Re-insert to mark as most recently used
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            self._evict()
+
+    def get_or_create(self, key, factory):
+        """Return the cached value for 'key', calling factory() on a miss.
+
+        The factory runs outside the lock; if two threads miss on the same
+        key concurrently the first value stored wins.
+        """
+        marker = _MISSING
+        value = self.get(key, marker)
+        if value is marker:
+            value = factory()
+            with self._lock:
+                value = self._data.get(key, value)
+                self.put(key, value)
+
+        return value
+
+    def clear(self):
+        """Drop all entries and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._data),
+                'capacity': self._capacity,
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __repr__(self):
+        return '<LRUCache {0}>'.format(self.stats())
+
+_MISSING = object()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+"""
+@package udunitspy.convert
+@file udunitspy/convert.py
+@author Christopher Mueller
+@brief Memory-mapped file-to-file unit conversion
+
+Usage:
+    udunits-convert [-h] [--dtype DTYPE] [--offset OFFSET] [--out-dtype OUT_DTYPE]
+                    [--block-size BLOCK_SIZE] src dst from_unit to_unit
+"""
+
+import argparse
+import mmap
+import os
+import sys
+import numpy as np
+from udunitspy.udunits2 import Unit, NATIVE_DTYPES
+
+# Default number of bytes read per block: a whole number of pages
+BLOCK_SIZE = 4096 * mmap.PAGESIZE
+
+def _is_npy(path):
+    return path.lower().endswith('.npy')
+
+def convert_file(src, dst, from_unit, to_unit, dtype='float64', offset=0, out_dtype=None,
+                 block_size=BLOCK_SIZE, system=None):
+    """Convert the values stored in 'src' from 'from_unit' to 'to_unit' and write them to 'dst'.
+
+    'src' is either a .npy file (its own dtype and shape are used) or a raw
+    binary file of 'dtype' values starting 'offset' bytes into the file.  Both
+    files are memory-mapped and converted 'block_size' bytes (rounded to whole
+    pages) at a time, so memory use does not depend on the file size.  'dst' is
+    written as a .npy file if its name ends in .npy, raw binary otherwise, with
+    'out_dtype' values (default: the input dtype for float32/float64 input,
+    float64 for anything else).
+
+    If 'src' and 'dst' are the same file it is converted in place, which
+    needs 'out_dtype' to be the input dtype; a raw file keeps the bytes
+    before 'offset'.
+
+    Returns the number of values converted.
+    """
+    converter = Unit(from_unit, system=system).get_converter(to_unit)
+    if converter is None:
+        raise ValueError('\'{0}\' cannot be converted to \'{1}\''.format(from_unit, to_unit))
+
+    # Opening 'dst' for writing would truncate 'src'
+    in_place = os.path.realpath(src) == os.path.realpath(dst)
+    mode = 'r+' if in_place else 'r'
+    if _is_npy(src):
+        inarr = np.load(src, mmap_mode=mode)
+    else:
+        inarr = np.memmap(src, dtype=np.dtype(dtype), mode=mode, offset=offset)
+
+    if out_dtype is None:
+        out_dtype = inarr.dtype if inarr.dtype in NATIVE_DTYPES else np.float64
+    out_dtype = np.dtype(out_dtype)
+
+    if in_place:
+        if out_dtype != inarr.dtype:
+            raise ValueError('\'{0}\' can only be converted in place to its own dtype {1}, not {2}'.format(
+                src, inarr.dtype, out_dtype))
+        outarr = inarr
+    elif _is_npy(dst):
+        outarr = np.lib.format.open_memmap(dst, mode='w+', dtype=out_dtype, shape=inarr.shape)
+    else:
+        outarr = np.memmap(dst, dtype=out_dtype, mode='w+', shape=inarr.shape)
+
+    pages = max(1, int(block_size) // mmap.PAGESIZE)
+    chunk_size = max(1, pages * mmap.PAGESIZE // inarr.dtype.itemsize)
+    converter.convert_chunked(inarr, chunk_size=chunk_size, out=outarr)
+    outarr.flush()
+
+    size = inarr.size
+    del inarr, outarr
+    return size
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert a binary or .npy file of values between units')
+    parser.add_argument('src', help='input file (.npy or raw binary)')
+    parser.add_argument('dst', help='output file (.npy or raw binary)')
+    parser.add_argument('from_unit', help='units of the input values')
+    parser.add_argument('to_unit', help='units of the output values')
+    parser.add_argument('--dtype', default='float64', help='dtype of a raw input file (default: %(default)s)')
+    parser.add_argument('--offset', type=int, default=0, help='byte offset of the data in a raw input file')
+    parser.add_argument('--out-dtype', default=None, help='dtype of the output values')
+    parser.add_argument('--block-size', type=int, default=BLOCK_SIZE,
+                        help='bytes converted per block (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    try:
+        convert_file(args.src, args.dst, args.from_unit, args.to_unit, dtype=args.dtype, offset=args.offset,
+                     out_dtype=args.out_dtype, block_size=args.block_size)
+    except Exception as ex:
+        parser.exit(1, '{0}: error: {1}\n'.format(parser.prog, ex))
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+
+"""
+@package udunitspy.instrumentation
+@file udunitspy/instrumentation.py
+@author Christopher Mueller
+@brief Opt-in call counters, latencies and element counts for the udunits hot paths
+
+Instrumentation is off by default.  enable() swaps instrumented wrappers in
+for the udunits2_c functions used by udunitspy.udunits2 and for the
+Converter evaluation methods; disable() puts the originals back, so nothing
+is paid while it is off.
+"""
+
+from collections import deque
+import logging
+import threading
+import timeit
+import numpy as np
+from udunitspy.udunits2 import ut, Converter
+
+log = logging.getLogger(__name__)
+
+# Latencies kept per operation for the percentiles (the most recent ones)
+SAMPLE_SIZE = 1024
+
+PERCENTILES = (50, 90, 99)
+
+def _one(args):
+    return 1
+
+def _array_elements(args):
+    # The array is the second argument of both cv_convert_buffer(converter,
+    # in, out) and the Converter methods (self, value)
+    return np.size(args[1])
+
+# udunits2_c functions wrapped by enable(), with how to count the elements
+# each call processes (None: not counted)
+C_CALLS = (
+    ('read_xml_status', None),
+    ('parse_status', None),
+    ('format', None),
+    ('are_convertible', None),
+    ('get_converter_status', None),
+    ('cv_combine', None),
+    ('cv_get_expression', None),
+    ('cv_convert_double', _one),
+    ('cv_convert_buffer', _array_elements),
+)
+
+# Converter methods wrapped by enable(): _evaluate is the general path for
+# anything the C buffer conversion can't take as-is, _convert_copy the part
+# of it converting a float64 copy for non-affine converters
+CONVERTER_METHODS = (
+    ('_evaluate', _array_elements),
+    ('_convert_copy', _array_elements),
+)
+
+class OperationStats(object):
+    """Counters for one instrumented operation."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.elements = 0
+        self.samples = deque(maxlen=SAMPLE_SIZE)
+
+    def record(self, seconds, elements):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.elements += elements
+        self.samples.append(seconds)
+
+    def snapshot(self):
+        samples = sorted(self.samples)
+        result = {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'max': self.max,
+            'elements': self.elements,
+        }
+        for p in PERCENTILES:
+            # Nearest-rank percentile of the recent samples
+            index = max(0, int(np.ceil(p / 100.0 * len(samples))) - 1)
+            result['p{0}'.format(p)] = samples[index] if samples else 0.0
+
+        return result
+
+class _Recorder(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.operations = {}
+        self.callback = None
+
+    def record(self, name, seconds, elements):
+        with self.lock:
+            stats = self.operations.get(name)
+            if stats is None:
+                stats = self.operations[name] = OperationStats()
+            stats.record(seconds, elements)
+
+        callback = self.callback
+        if callback is not None:
+            try:
+                callback(name, seconds, elements)
+            except Exception:
+                log.exception('Instrumentation callback failed for %s', name)
+
+_recorder = _Recorder()
+# Wrapped objects and attributes -> original function, while enabled
+_originals = {}
+_timer = timeit.default_timer
+
+def _wrap(name, func, count_elements):
+    def wrapper(*args, **kwargs):
+        start = _timer()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _recorder.record(name, _timer() - start, count_elements(args) if count_elements else 0)
+
+    wrapper.__name__ = getattr(func, '__name__', name)
+    wrapper.__doc__ = getattr(func, '__doc__', None)
+    return wrapper
+
+def enable(callback=None):
+    """Start recording.  'callback', if given, is called as
+    callback(name, seconds, elements) after every instrumented call, on the
+    calling thread; use it to feed a metrics exporter.
+    """
+    with _recorder.lock:
+        _recorder.callback = callback
+        if _originals:
+            return
+
+        for name, count_elements in C_CALLS:
+            func = getattr(ut, name)
+            _originals[(ut, name)] = func
+            setattr(ut, name, _wrap('ut.' + name, func, count_elements))
+        for name, count_elements in CONVERTER_METHODS:
+            func = Converter.__dict__[name]
+            _originals[(Converter, name)] = func
+            setattr(Converter, name, _wrap('Converter.' + name, func, count_elements))
+
+def disable():
+    """Stop recording and restore the uninstrumented functions.  The
+    statistics gathered so far are kept until reset()."""
+    with _recorder.lock:
+        for (owner, name), func in _originals.items():
+            setattr(owner, name, func)
+        _originals.clear()
+        _recorder.callback = None
+
+def is_enabled():
+    return bool(_originals)
+
+def reset():
+    """Forget all recorded statistics."""
+    with _recorder.lock:
+        _recorder.operations.clear()
+
+def stats(reset=False):
+    """Snapshot of the recorded statistics: a dict mapping each operation
+    name ('ut.parse', 'Converter._evaluate', ...) to its call count, total,
+    mean and max seconds, p50/p90/p99 latencies over the last SAMPLE_SIZE
+    calls and number of elements processed.  With reset=True the statistics
+    are cleared after the snapshot is taken.
+    """
+    with _recorder.lock:
+        snapshot = dict((name, op.snapshot()) for name, op in _recorder.operations.items())
+        if reset:
+            _recorder.operations.clear()
+
+    return snapshot
@@ -59,7 +59,7 @@ ISO8601_REGEX = re.compile(r"(?P<year>[0-9]{1,4})(-(?P<month>[0-9]{1,2})(-(?P<da
 )
 TIMEZONE_REGEX = re.compile("(?P<prefix>[+-])(?P<hours>[0-9]{1,2}):(?P<minutes>[0-9]{1,2})")
 
-class datetime:
+class datetime(object):
     """
 Phony datetime object which mimics the python datetime object,
 but allows for dates that don't exist in the proleptic gregorian calendar.
@@ -70,8 +70,12 @@ of the string produced by __repr__ is controlled by self.format
 (default %Y-%m-%d %H:%M:%S).
 
 Instance variables are year,month,day,hour,minute,second,dayofwk,dayofyr
-and format.
+and format.  Instances have no __dict__, so that arrays of millions of them
+stay small.  They compare, order and hash as the tuple
+(year,month,day,hour,minute,second), also against python datetime objects.
     """
+    __slots__ = ('year','month','day','hour','minute','second','dayofwk','dayofyr','_format')
+
     def __init__(self,year,month,day,hour=0,minute=0,second=0,dayofwk=-1,dayofyr=1):
         """dayofyr set to 1 by default - otherwise time.strftime will complain"""
         self.year=year
@@ -82,18 +86,126 @@ and format.
         self.dayofwk=dayofwk
         self.dayofyr=dayofyr
         self.second=second
-        self.format='%Y-%m-%d %H:%M:%S'
+        self._format=None
+    def _get_format(self):
+        return self._format or _DEFAULT_FORMAT
+    def _set_format(self,format):
+        self._format=format
+    format = property(_get_format,_set_format)
     def strftime(self,format=None):
         if format is None:
             format = self.format
-        return _strftime(self,format)
+        template = _compile_format(format)
+        if template is None:
+            return _strftime(self,format)
+        return template.format(self.year,self.month,self.day,self.hour,self.minute,int(self.second),self.dayofyr)
     def timetuple(self):
         return (self.year,self.month,self.day,self.hour,self.minute,self.second,self.dayofwk,self.dayofyr,-1)
     def __repr__(self):
         return self.strftime(self.format)
-    def __eq__(self, date):
-        return self.strftime('%Y-%m-%d %H:%M:%S') == date.strftime('%Y-%m-%d %H:%M:%S')
-
+    def __reduce__(self):
+        return (datetime,(self.year,self.month,self.day,self.hour,self.minute,self.second,self.dayofwk,self.dayofyr),
+                self._format)
+    def __setstate__(self,format):
+        self._format=format
+    def _key(self):
+        return (self.year,self.month,self.day,self.hour,self.minute,self.second)
+    def __hash__(self):
+        # Equal to the python datetime with the same fields (when there is
+        # one), so it has to hash like it
+        try:
+            second = int(self.second)
+            return hash(real_datetime(int(self.year),int(self.month),int(self.day),int(self.hour),int(self.minute),
+                                      second,int(round((self.second-second)*1e6))))
+        except (ValueError,TypeError,OverflowError):
+            return hash(self._key())
+    def __eq__(self,date):
+        other = _datekey(date)
+        if other is None:
+            return NotImplemented
+        return self._key() == other
+    def __ne__(self,date):
+        other = _datekey(date)
+        if other is None:
+            return NotImplemented
+        return self._key() != other
+    def __lt__(self,date):
+        other = _datekey(date)
+        if other is None:
+            return NotImplemented
+        return self._key() < other
+    def __le__(self,date):
+        other = _datekey(date)
+        if other is None:
+            return NotImplemented
+        return self._key() <= other
+    def __gt__(self,date):
+        other = _datekey(date)
+        if other is None:
+            return NotImplemented
+        return self._key() > other
+    def __ge__(self,date):
+        other = _datekey(date)
+        if other is None:
+            return NotImplemented
+        return self._key() >= other
+
+_DEFAULT_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def _datekey(date):
+    """(year,month,day,hour,minute,second) of a phony or real datetime, or
+    None for anything else.  The microseconds of a real datetime count as a
+    fraction of its second."""
+    try:
+        second = date.second
+        if isinstance(date,real_datetime) and date.microsecond:
+            second = second + date.microsecond/1e6
+        return (date.year,date.month,date.day,date.hour,date.minute,second)
+    except AttributeError:
+        return None
+
+# strftime directives that are formatted without time.strftime:
+# (index into (year,month,day,hour,minute,second,dayofyr), format spec).
+# The year is padded like _strftime does it.
+_FORMAT_SPECS = {'Y':(0,'4d'),'m':(1,'02d'),'d':(2,'02d'),'H':(3,'02d'),
+                 'M':(4,'02d'),'S':(5,'02d'),'j':(6,'03d')}
+_FORMAT_DIRECTIVE = re.compile(r'%(.)')
+_format_templates = {}
+
+def _format_pieces(format):
+    """Split a strftime format string into literal strings and
+    (index, spec) fields, or return None if it uses directives that need
+    time.strftime."""
+    pieces = []
+    pos = 0
+    for m in _FORMAT_DIRECTIVE.finditer(format):
+        pieces.append(format[pos:m.start()])
+        directive = m.group(1)
+        if directive == '%':
+            pieces.append('%')
+        elif directive in _FORMAT_SPECS:
+            pieces.append(_FORMAT_SPECS[directive])
+        else:
+            return None
+        pos = m.end()
+    pieces.append(format[pos:])
+    return [piece for piece in pieces if piece != '']
+
+def _compile_format(format):
+    """Return the str.format template for a strftime format string, or None
+    if it uses directives that need time.strftime."""
+    try:
+        return _format_templates[format]
+    except KeyError:
+        pass
+    pieces = _format_pieces(format)
+    template = None
+    if pieces is not None:
+        template = ''.join([('{%d:%s}' % piece) if isinstance(piece, tuple)
+                            else piece.replace('{','{{').replace('}','}}') for piece in pieces])
+    if len(_format_templates) < 256:
+        _format_templates[format] = template
+    return template
 
 def JulianDayFromDate(date,calendar='standard'):
 
@@ -225,6 +337,85 @@ Returns the fractional Julian Day (resolution 1 second).
     
     return jd 
 
+def _JulianDayFromFields(year,month,day,hour=0,minute=0,second=0,calendar='standard'):
+
+    """
+
+vectorized counterpart of L{JulianDayFromDate}, L{_NoLeapDayFromDate},
+L{_AllLeapFromDate} and L{_360DayFromDate}: creates fractional Julian Days
+from (broadcastable) arrays of year, month, day, hour, minute and second
+for any of the supported calendars.  second may be fractional.
+
+NaN in any of the inputs gives NaN.
+
+    """
+
+    year = numpy.asarray(year, dtype='d')
+    month = numpy.asarray(month, dtype='d')
+    day = numpy.asarray(day, dtype='d')
+    valid = ~(numpy.isnan(year) | numpy.isnan(month) | numpy.isnan(day))
+    if calendar in ['noleap','365_day']:
+        if numpy.any((month == 2) & (day == 29) & valid):
+            raise ValueError('there is no leap day in the noleap calendar')
+    elif calendar == '360_day':
+        if numpy.any((day > 30) & valid):
+            raise ValueError('there are only 30 days in every month with the 360_day calendar')
+    # Convert time to fractions of a day
+    day = day + numpy.asarray(hour)/24.0 + numpy.asarray(minute)/1440.0 + numpy.asarray(second)/86400.0
+
+    if calendar == '360_day':
+        return numpy.trunc(360. * (year + 4716)) + numpy.trunc(30. * (month - 1)) + day
+
+    # Start Meeus algorithm (variables are in his notation)
+    with numpy.errstate(invalid='ignore'):
+        return _MeeusFromFields(year,month,day,calendar)
+
+def _MeeusFromFields(year,month,day,calendar):
+    early = month < 3
+    month = numpy.where(early, month + 12, month)
+    year = numpy.where(early, year - 1, year)
+
+    if calendar in ['noleap','365_day']:
+        return numpy.trunc(365. * (year + 4716)) + numpy.trunc(30.6001 * (month + 1)) + day - 1524.5
+    elif calendar in ['all_leap','366_day']:
+        return numpy.trunc(366. * (year + 4716)) + numpy.trunc(30.6001 * (month + 1)) + day - 1524.5
+
+    jd = numpy.trunc(365.25 * (year + 4716)) + numpy.trunc(30.6001 * (month + 1)) + day - 1524.5
+
+    # the gregorian correction, with integer division as in JulianDayFromDate
+    A = numpy.floor(year/100.)
+    gregorian = 2 - A + numpy.floor(A/4.)
+    if calendar in ['standard','gregorian']:
+        if numpy.any((jd >= 2299160.5) & (jd < 2299170.5)):
+            raise ValueError('impossible date (falls in gap between end of Julian calendar and beginning of Gregorian calendar')
+        B = numpy.where(jd >= 2299170.5, gregorian, 0)
+    elif calendar == 'proleptic_gregorian':
+        B = gregorian
+    elif calendar == 'julian':
+        B = 0
+    else:
+        raise ValueError('unknown calendar, must be one of %s, got %s' % (str(_calendars), calendar))
+
+    return jd + B
+
+def _datetime64_fields(dates):
+    """
+
+splits a numpy datetime64 array into year, month, day arrays plus the
+fractional seconds since midnight.  NaT gives NaN in every field.
+
+    """
+    dates = numpy.asarray(dates)
+    nat = numpy.isnat(dates)
+    years = dates.astype('M8[Y]')
+    months = dates.astype('M8[M]')
+    days = dates.astype('M8[D]')
+    fields = [years.astype('i8') + 1970.,
+              (months - years).astype('m8[M]').astype('i8') + 1.,
+              (days - months).astype('m8[D]').astype('i8') + 1.,
+              (dates - days) / numpy.timedelta64(1, 's')]
+    return [numpy.where(nat, numpy.nan, field) for field in fields]
+
 def DateFromJulianDay(JD,calendar='standard'):
     """
 
@@ -265,11 +456,11 @@ Virginia. p. 63
             A = Z
         else:
             alpha = int((Z - 1867216.25)/36524.25)
-            A = Z + 1 + alpha - int(alpha/4)
+            A = Z + 1 + alpha - int(alpha/4.)
 
     elif calendar == 'proleptic_gregorian':
         alpha = int((Z - 1867216.25)/36524.25)
-        A = Z + 1 + alpha - int(alpha/4)
+        A = Z + 1 + alpha - int(alpha/4.)
     elif calendar == 'julian':
         A = Z
     else:
@@ -496,6 +687,76 @@ Julian Day is a fractional day with a resolution of 1 second.
     
     return datetime(year,month,int(days),int(hours),int(minutes),int(seconds),-1, int(dayofyr))
 
+DATE_FIELDS_DTYPE = numpy.dtype([('year','i4'),('month','i4'),('day','i4'),
+                                 ('hour','i4'),('minute','i4'),('second','i4')])
+
+def _DateFieldsFromJulianDay(JD,calendar='standard'):
+    """
+
+vectorized counterpart of L{DateFromJulianDay}, L{_DateFromNoLeapDay},
+L{_DateFromAllLeap} and L{_DateFrom360Day}: returns a structured array of
+dtype L{DATE_FIELDS_DTYPE} given an array of Julian Days in any of the
+supported calendars.  Seconds are rounded, as in the scalar versions.
+
+NaN Julian Days give all-zero fields; callers are expected to mask them.
+
+    """
+
+    JD = numpy.asarray(JD, dtype='d')
+    missing = numpy.isnan(JD)
+    JD = numpy.where(missing, 0., JD)
+    if numpy.any(JD < 0):
+        raise ValueError('Julian Day must be positive')
+
+    # whole days and rounded seconds of day, carrying into the next day
+    # (360_day Julian Days start at midnight, the others at noon)
+    if calendar != '360_day':
+        JD = JD + 0.5
+    Z = numpy.floor(JD)
+    seconds = numpy.round((JD - Z) * 86400.)
+    carry = seconds >= 86400
+    Z = (Z + carry).astype('i8')
+    seconds = numpy.where(carry, 0, seconds).astype('i8')
+
+    if calendar == '360_day':
+        year = numpy.trunc((Z - 0.5)/360.).astype('i8') - 4716
+        dayofyr = Z - (year + 4716)*360
+        month = numpy.trunc((dayofyr - 0.5)/30).astype('i8') + 1
+        day = dayofyr - (month - 1)*30
+    else:
+        if calendar in ['standard','gregorian']:
+            alpha = numpy.trunc((Z - 1867216.25)/36524.25).astype('i8')
+            A = numpy.where(JD < 2299161, Z, Z + 1 + alpha - numpy.trunc(alpha/4.).astype('i8'))
+        elif calendar == 'proleptic_gregorian':
+            alpha = numpy.trunc((Z - 1867216.25)/36524.25).astype('i8')
+            A = Z + 1 + alpha - numpy.trunc(alpha/4.).astype('i8')
+        elif calendar in ['julian','noleap','365_day','all_leap','366_day']:
+            A = Z
+        else:
+            raise ValueError('unknown calendar, must be one of %s, got %s' % (str(_calendars), calendar))
+        daysinyear = 365.25
+        if calendar in ['noleap','365_day']:
+            daysinyear = 365.
+        elif calendar in ['all_leap','366_day']:
+            daysinyear = 366.
+        B = A + 1524
+        C = numpy.trunc((B - 122.1)/daysinyear).astype('i8')
+        D = numpy.trunc(daysinyear * C).astype('i8')
+        E = numpy.trunc((B - D)/30.6001).astype('i8')
+        day = B - D - numpy.trunc(30.6001 * E).astype('i8')
+        month = numpy.where(E < 14, E - 1, E - 13)
+        year = numpy.where(month > 2, C - 4716, C - 4715)
+
+    fields = numpy.empty(JD.shape, DATE_FIELDS_DTYPE)
+    fields['year'] = year
+    fields['month'] = month
+    fields['day'] = day
+    fields['hour'] = seconds // 3600
+    fields['minute'] = seconds % 3600 // 60
+    fields['second'] = seconds % 60
+    fields[missing] = 0
+    return fields
+
 def _dateparse(timestr):
     """parse a string of the form time-units since yyyy-mm-dd hh:mm:ss
     return a tuple (units, datetimeinstance)"""
@@ -683,7 +944,13 @@ a date between 1582-10-5 and 1582-10-15.
 
 Works for scalars, sequences and numpy arrays.
 Returns a scalar if input is a scalar, else returns a numpy array.
+
+numpy C{datetime64} arrays (of any resolution) are converted without
+creating any python objects.  NaT values give NaN.
         """
+        if isinstance(date, (numpy.ndarray, numpy.datetime64)) and numpy.asarray(date).dtype.kind == 'M':
+            year, month, day, second = _datetime64_fields(date)
+            return self.fields2num(year, month, day, second=second)
         isscalar = False
         try:
             date[0]
@@ -726,6 +993,24 @@ Returns a scalar if input is a scalar, else returns a numpy array.
                     jdelta.append(_360DayFromDate(d)-self._jd0)
         if not isscalar:
             jdelta = numpy.array(jdelta)
+        jdelta = self._jdelta2num(jdelta)
+        if isscalar:
+            return jdelta
+        else:
+            return numpy.reshape(jdelta,shape)
+
+    def fields2num(self,year,month,day,hour=0,minute=0,second=0):
+        """
+Vectorized L{date2num} for dates given as parallel (broadcastable) arrays of
+C{year}, C{month}, C{day}, C{hour}, C{minute} and C{second} in the
+specified L{calendar}.  C{second} may be fractional.
+
+Returns a numpy array (or a numpy scalar for scalar fields).
+        """
+        jd = _JulianDayFromFields(year,month,day,hour,minute,second,self.calendar)
+        return self._jdelta2num(jd - self._jd0)
+
+    def _jdelta2num(self,jdelta):
         # convert to desired units, add time zone offset.
         if self.units in ['second','seconds']:
             jdelta = jdelta*86400. + self.tzoffset*60.
@@ -735,12 +1020,9 @@ Returns a scalar if input is a scalar, else returns a numpy array.
             jdelta = jdelta*24. + self.tzoffset/60.
         elif self.units in ['day','days']:
             jdelta = jdelta + self.tzoffset/1440.
-        if isscalar:
-            return jdelta
-        else:
-            return numpy.reshape(jdelta,shape)
+        return jdelta
 
-    def num2date(self,time_value):
+    def num2date(self,time_value,as_datetime64=False,as_fields=False):
         """
 Return a 'datetime-like' object given a C{time_value} in units
 described by L{unit_string}, using L{calendar}.
@@ -761,7 +1043,21 @@ objects which are actually instances of netcdftime.datetime.  This is
 because the python datetime module cannot handle the weird dates in some 
 calendars (such as C{'360_day'} and C{'all_leap'}) which 
 do not exist in any real world calendar.
+
+If C{as_fields=True}, the whole array is converted at once and a numpy
+structured array of dtype L{DATE_FIELDS_DTYPE} (year, month, day, hour,
+minute, second) is returned instead, for any calendar.  Masked input gives
+a masked result.
+
+If C{as_datetime64=True}, the whole array is converted at once and a numpy
+C{datetime64[s]} array is returned for the C{'proleptic_gregorian'},
+C{'standard'} and C{'gregorian'} calendars (the latter two only for dates
+after 1582-10-15).  Masked and NaN values give NaT.  Dates in the other
+calendars cannot be represented by C{datetime64}, so the field array
+described above is returned for them.
         """
+        if as_datetime64 or as_fields:
+            return self._num2fields(time_value, as_datetime64)
         isscalar = False
         try:
             time_value[0]
@@ -774,16 +1070,7 @@ do not exist in any real world calendar.
         if not isscalar:
             time_value = numpy.array(time_value, dtype='d')
             shape = time_value.shape
-        # convert to desired units, remove time zone offset.
-        if self.units in ['second','seconds']:
-            jdelta = time_value/86400. - self.tzoffset/1440.
-        elif self.units in ['minute','minutes']:
-            jdelta = time_value/1440. - self.tzoffset/1440.
-        elif self.units in ['hour','hours']:
-            jdelta = time_value/24. - self.tzoffset/1440.
-        elif self.units in ['day','days']:
-            jdelta = time_value - self.tzoffset/1440.
-        jd = self._jd0 + jdelta
+        jd = self._num2jd(time_value)
         if self.calendar in ['julian','standard','gregorian','proleptic_gregorian']:
             if not isscalar:
                 if ismasked:
@@ -820,6 +1107,40 @@ do not exist in any real world calendar.
         else:
             return numpy.reshape(numpy.array(date),shape)
 
+    def _num2jd(self,time_value):
+        # convert to desired units, remove time zone offset.
+        if self.units in ['second','seconds']:
+            jdelta = time_value/86400. - self.tzoffset/1440.
+        elif self.units in ['minute','minutes']:
+            jdelta = time_value/1440. - self.tzoffset/1440.
+        elif self.units in ['hour','hours']:
+            jdelta = time_value/24. - self.tzoffset/1440.
+        elif self.units in ['day','days']:
+            jdelta = time_value - self.tzoffset/1440.
+        return self._jd0 + jdelta
+
+    def _num2fields(self,time_value,as_datetime64):
+        mask = numpy.ma.getmask(time_value)
+        time_value = numpy.ma.filled(numpy.ma.asarray(time_value, dtype='d'), numpy.nan)
+        mask = mask | numpy.isnan(time_value)
+        # missing values are converted as the reference time, then masked
+        jd = numpy.where(mask, self._jd0, self._num2jd(time_value))
+        realcalendar = self.calendar in ['standard','gregorian','proleptic_gregorian']
+        if as_datetime64 and realcalendar:
+            if self.calendar != 'proleptic_gregorian' and numpy.any(jd < 2299160.5):
+                raise ValueError('dates before 1582-10-15 cannot be represented as datetime64 in the %s calendar' % self.calendar)
+            # seconds since 1970-01-01, the datetime64 epoch
+            seconds = numpy.round((jd - 2440587.5) * 86400.)
+            dates = numpy.where(mask, numpy.datetime64('NaT'), seconds.astype('i8').astype('M8[s]'))
+        else:
+            dates = _DateFieldsFromJulianDay(jd, self.calendar)
+            if numpy.any(mask):
+                dates = numpy.ma.array(dates, mask=numpy.broadcast_to(mask, dates.shape))
+        # a scalar for scalar input, like num2date
+        if dates.ndim == 0:
+            return dates[()]
+        return dates
+
 def _parse_timezone(tzstring):
     """Parses ISO 8601 time zone specs into tzinfo offsets
 
@@ -920,6 +1241,43 @@ def _strftime(dt, fmt):
         s = s[:site] + syear + s[site+4:]
     return s
 
+# utime instances used by date2num, num2date and date2index, keyed by
+# (units, calendar).  Resize with UTIME_CACHE.capacity = n
+UTIME_CACHE_SIZE = 128
+
+class _UtimeCache(object):
+    """Stand-in for the udunitspy.cache.LRUCache of utime instances; builds
+    it on first use, so that importing this module doesn't import the
+    udunits extension along with the udunitspy package.
+    """
+
+    def _cache(self):
+        cache = self.__dict__.get('cache')
+        if cache is None:
+            from udunitspy.cache import LRUCache
+            cache = self.__dict__.setdefault('cache', LRUCache(UTIME_CACHE_SIZE))
+        return cache
+
+    def __getattr__(self, name):
+        return getattr(self._cache(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cache(), name, value)
+
+    def __len__(self):
+        return len(self._cache())
+
+    def __contains__(self, key):
+        return key in self._cache()
+
+    def __repr__(self):
+        return repr(self._cache())
+
+UTIME_CACHE = _UtimeCache()
+
+def _get_utime(units,calendar='standard'):
+    return UTIME_CACHE.get_or_create((units,calendar), lambda: utime(units,calendar=calendar))
+
 def date2num(dates,units,calendar='standard'):
     """
 date2num(dates,units,calendar='standard')
@@ -955,12 +1313,12 @@ C{calendar = 'proleptic_gregorian'}.
 
 The maximum resolution of the numeric time values is 1 second.
     """
-    cdftime = utime(units,calendar=calendar)
+    cdftime = _get_utime(units,calendar)
     return cdftime.date2num(dates)
 
-def num2date(times,units,calendar='standard'):
+def num2date(times,units,calendar='standard',as_datetime64=False,as_fields=False):
     """
-num2date(times,units,calendar='standard')
+num2date(times,units,calendar='standard',as_datetime64=False,as_fields=False)
 
 Return datetime objects given numeric time values. The units
 of the numeric time values are described by the C{units} argument
@@ -999,65 +1357,227 @@ the uses the C{'proleptic_gregorian'} calendar, even before the switch
 occured from the Julian calendar in 1582. The datetime instances
 do not contain a time-zone offset, even if the specified C{units}
 contains one.
-    """
-    cdftime = utime(units,calendar=calendar)
-    return cdftime.num2date(times)
 
-def _check_index(indices, dates, nctime, calendar, select):
-    """Return True if the time indices given correspond to the given dates, 
-    False otherwise.
-    
-    Parameters: 
+@param as_datetime64: if True, return a numpy C{datetime64} array where the
+calendar allows it, see L{utime.num2date}.
 
-    indices : sequence of integers
-    Positive integers indexing the time variable.
+@param as_fields: if True, return a numpy structured array of date fields,
+see L{utime.num2date}.
+    """
+    cdftime = _get_utime(units,calendar)
+    return cdftime.num2date(times,as_datetime64=as_datetime64,as_fields=as_fields)
 
-    dates : sequence of datetime objects
-    Reference dates.
+class CalendarDateArray(object):
+    """
+Columnar array of dates in any of the supported calendars.
 
-    nctime : netCDF Variable object
-    NetCDF time object.
+To initialize: C{dates = CalendarDateArray(year,month,day,hour=0,minute=0,second=0,calendar='standard')}
 
-    calendar : string
-    Calendar of nctime.
+The year, month, day, hour, minute and second fields are held as
+(broadcastable inputs turned into) contiguous integer arrays of the same
+shape, with the calendar attached.  Comparisons, slicing, sorting,
+L{strftime} and conversion to and from numeric time values (L{from_num},
+L{to_num}) work on the whole arrays, without creating python objects.
+Indexing with an integer returns a L{datetime}.
 
-    select : string
-    Index selection method.
+Dates of different calendars cannot be compared with each other.
     """
-    N = nctime.shape[0]
-    if  (indices <0).any():
-       return False
-       
-    if (indices >= N).any():
-        return False
-        
-    t = nctime[indices] 
-# if fancy indexing not available, fall back on this.
-#   t=[]
-#   for ind in indices:
-#       t.append(nctime[ind])
+    _fields = ('year','month','day','hour','minute','second')
+
+    def __init__(self,year,month,day,hour=0,minute=0,second=0,calendar='standard'):
+        if calendar not in _calendars:
+            raise ValueError('unknown calendar, must be one of %s, got %s' % (str(_calendars), calendar))
+        self.calendar = calendar
+        arrays = numpy.broadcast_arrays(*[numpy.asarray(a) for a in (year,month,day,hour,minute,second)])
+        for name, a in zip(self._fields, arrays):
+            setattr(self, name, numpy.array(a, dtype='i4', order='C'))
+
+    @classmethod
+    def from_fields(cls,fields,calendar='standard'):
+        """Create from a structured array with year, month, day, hour, minute
+        and second fields, such as L{utime.num2date} returns with
+        C{as_fields=True}."""
+        if numpy.ma.isMaskedArray(fields) and \
+                any(numpy.ma.getmaskarray(fields)[name].any() for name in cls._fields):
+            raise ValueError('CalendarDateArray cannot hold masked dates')
+        fields = numpy.ma.getdata(fields)
+        return cls(*[fields[name] for name in cls._fields], calendar=calendar)
+
+    @classmethod
+    def from_num(cls,time_value,units,calendar='standard'):
+        """Create from numeric time values in C{units} ('<time units> since
+        <reference time>')."""
+        return cls.from_fields(_get_utime(units,calendar).num2date(time_value,as_fields=True),calendar)
+
+    @classmethod
+    def from_dates(cls,dates,calendar='standard'):
+        """Create from a sequence of L{datetime} or python datetime objects."""
+        keys = [_datekey(date) for date in dates]
+        if None in keys:
+            raise TypeError('dates must be datetime objects')
+        fields = numpy.array(keys, dtype='i4').reshape(-1, 6)
+        return cls(*fields.T, calendar=calendar)
+
+    def to_num(self,units):
+        """Return the numeric time values of the dates in C{units}
+        ('<time units> since <reference time>')."""
+        return _get_utime(units,self.calendar).fields2num(*self._columns())
+
+    def to_fields(self):
+        """Return the dates as a structured array of dtype L{DATE_FIELDS_DTYPE}."""
+        fields = numpy.empty(self.shape, DATE_FIELDS_DTYPE)
+        for name in self._fields:
+            fields[name] = getattr(self, name)
+        return fields
+
+    def _columns(self):
+        return [getattr(self, name) for name in self._fields]
+
+    @property
+    def shape(self):
+        return self.year.shape
+
+    @property
+    def dayofyr(self):
+        """Day of the year (1 for January 1st) of every date."""
+        ones = numpy.ones_like(self.year)
+        return (_JulianDayFromFields(self.year,self.month,self.day,calendar=self.calendar) -
+                _JulianDayFromFields(self.year,ones,ones,calendar=self.calendar)).astype('i4') + 1
+
+    def __len__(self):
+        return len(self.year)
+
+    def __getitem__(self,index):
+        columns = [a[index] for a in self._columns()]
+        if columns[0].ndim == 0:
+            return datetime(*[int(a) for a in columns])
+        return CalendarDateArray(*columns, calendar=self.calendar)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
 
-    check = num2date(t, nctime.units, calendar)
-    if select == 'exact':
-        return numpy.all(check == dates)
-        
-    elif select == 'before':
-        ta = nctime[numpy.clip(indices + 1, 0, N-1)]
-        check_after = num2date(ta, nctime.units, calendar)
-        return numpy.all(check <= dates) and numpy.all(check_after > dates)
-        
-    elif select == 'after':
-        tb = nctime[numpy.clip(indices - 1, 0, N-1)]
-        check_before = num2date(tb, nctime.units, calendar)
-        return numpy.all(check >= dates) and numpy.all(check_before < dates)
-    
-    elif select == 'nearest':
-        ta = nctime[numpy.clip(indices + 1, 0, N-1)]
-        tb = nctime[numpy.clip(indices - 1, 0, N-1)]
-        delta_after = num2date(ta, nctime.units, calendar) - check
-        delta_before = check - num2date(tb, nctime.units, calendar) 
-        delta_check = numpy.abs(dates-check)
-        return numpy.all(delta_check <= delta_after) and numpy.all(delta_check <= delta_before)
+    def __repr__(self):
+        return 'CalendarDateArray(%s, calendar=%r)' % (str(self.strftime()), self.calendar)
+
+    def _key(self):
+        # one int64 per date that orders like (year,month,day,hour,minute,second)
+        key = self.year.astype('i8')
+        for name, size in zip(self._fields[1:], (13,32,24,60,60)):
+            key = key * size + getattr(self, name)
+        return key
+
+    def _other_key(self,other):
+        if isinstance(other, CalendarDateArray):
+            if other.calendar != self.calendar:
+                raise ValueError('cannot compare dates in the %s and %s calendars' % (self.calendar, other.calendar))
+            return other._key()
+        key = _datekey(other)
+        if key is None:
+            return None
+        return CalendarDateArray(*key, calendar=self.calendar)._key()
+
+    def __eq__(self,other):
+        key = self._other_key(other)
+        if key is None:
+            return NotImplemented
+        return self._key() == key
+    def __ne__(self,other):
+        key = self._other_key(other)
+        if key is None:
+            return NotImplemented
+        return self._key() != key
+    def __lt__(self,other):
+        key = self._other_key(other)
+        if key is None:
+            return NotImplemented
+        return self._key() < key
+    def __le__(self,other):
+        key = self._other_key(other)
+        if key is None:
+            return NotImplemented
+        return self._key() <= key
+    def __gt__(self,other):
+        key = self._other_key(other)
+        if key is None:
+            return NotImplemented
+        return self._key() > key
+    def __ge__(self,other):
+        key = self._other_key(other)
+        if key is None:
+            return NotImplemented
+        return self._key() >= key
+
+    def argsort(self,axis=-1,kind='mergesort'):
+        """Return the indices that would sort the dates (stable by default)."""
+        return numpy.argsort(self._key(),axis=axis,kind=kind)
+
+    def sort(self,axis=-1,kind='mergesort'):
+        """Sort the dates in place."""
+        order = numpy.argsort(self._key(),axis=axis,kind=kind)
+        for name in self._fields:
+            setattr(self, name, numpy.take_along_axis(getattr(self, name), order, axis))
+
+    def strftime(self,format=None):
+        """Return a numpy string array with every date formatted with
+        C{format} (default %Y-%m-%d %H:%M:%S)."""
+        if format is None:
+            format = _DEFAULT_FORMAT
+        columns = self._columns() + [self.dayofyr]
+        chars = _format_chars(_format_pieces(format), [a.ravel() for a in columns])
+        if chars is None:
+            # needs time.strftime: one date at a time
+            dates = zip(*[a.ravel().tolist() for a in columns])
+            return numpy.array([datetime(y,m,d,H,M,S,-1,j).strftime(format) for y,m,d,H,M,S,j in dates],
+                               dtype=str).reshape(self.shape)
+        return chars.view('S%d' % chars.shape[1]).reshape(self.shape).astype(str)
+
+def _isascii(text):
+    try:
+        text.encode('ascii')
+    except UnicodeError:
+        return False
+    return True
+
+def _format_chars(pieces, columns):
+    """Format the pieces of a strftime format (see L{_format_pieces}) for
+    every row of the integer columns (year,month,day,hour,minute,second,
+    dayofyr) into a (rows, characters) array of ASCII codes.  Returns None
+    if that cannot be done with fixed-width fields."""
+    if pieces is None:
+        return None
+    size = len(columns[0])
+    parts = [numpy.zeros((size, 0), 'u1')]
+    for piece in pieces:
+        if isinstance(piece, tuple):
+            part = _format_digits(columns[piece[0]], piece[1])
+            if part is None:
+                return None
+        else:
+            if not _isascii(piece):
+                return None
+            part = numpy.tile(numpy.frombuffer(piece.encode('ascii'), 'u1'), (size, 1))
+        parts.append(part)
+    chars = numpy.ascontiguousarray(numpy.hstack(parts))
+    if chars.shape[1] == 0:
+        return None
+    return chars
+
+def _format_digits(values, spec):
+    """Format an integer array with a '4d' / '02d' style spec into a
+    (len(values), width) array of ASCII codes, or None if some values don't
+    fit the width."""
+    width = int(spec[:-1])
+    zero = spec.startswith('0')
+    if values.size and (values.min() < 0 or values.max() >= 10**width):
+        return None
+    chars = numpy.empty((len(values), width), 'u1')
+    for k in range(width):
+        power = 10 ** (width - 1 - k)
+        chars[:, k] = values // power % 10 + ord('0')
+        if not zero and power > 1:
+            chars[values < power, k] = ord(' ')
+    return chars
 
 def date2index(dates, nctime, calendar=None, select='exact'):
     """
@@ -1085,77 +1605,183 @@ def date2index(dates, nctime, calendar=None, select='exact'):
     corresponding to the dates just before or just after the given dates if 
     an exact match cannot be found. C{nearest} will return the indices that 
     correpond to the closest dates. 
+
+    The indices are first worked out from the first two values of C{nctime},
+    assuming uniformly spaced times, and checked against the values at and
+    around them; the whole time axis is only read (into a L{TimeIndex}) if
+    that check fails.  Use a L{TimeIndex} to answer many queries against the
+    same variable.
     """
-    # Setting the calendar.
+    if select not in ['exact', 'before', 'after', 'nearest']:
+        raise ValueError("%s is not an option for the `select` argument."%select)
     if calendar == None:
         calendar = getattr(nctime, 'calendar', 'standard')
-   
-    num = numpy.atleast_1d(date2num(dates, nctime.units, calendar))
+
+    index = _uniform_index(dates, nctime, calendar, select)
+    if index is None:
+        return TimeIndex(nctime, calendar).date2index(dates, select)
+
+    return _toscalar(index)
+
+def _uniform_index(dates, nctime, calendar, select):
+    # The indices date2index would return, inferred from the starting time and
+    # the stride and checked by reading nctime only at and next to them; None
+    # if the times around them are not uniform or a date is outside the axis
     N = len(nctime)
-    
-    # Trying to infer the correct index from the starting time and the stride.
-    # This assumes that the times are increasing uniformly.
-    t0, t1 = nctime[:2]
+    if N < 2:
+        return None
+    t = _get_utime(nctime.units, calendar)
+    num = numpy.atleast_1d(numpy.asarray(t.date2num(dates), dtype='d'))
+    t0, t1 = numpy.ravel(numpy.asarray(nctime[:2], dtype='d'))
     dt = t1 - t0
-    if select in ['exact', 'before']:
-        index = numpy.array((num-t0)/dt, int)
+    if num.size == 0 or not dt > 0:
+        return None
+    tolerance = _MATCH_TOLERANCE / _SECONDS[t.units]
+
+    with numpy.errstate(invalid='ignore'):
+        if select == 'exact':
+            index = numpy.rint((num - t0) / dt)
+        elif select == 'before':
+            index = numpy.floor((num + tolerance - t0) / dt)
+        elif select == 'after':
+            index = numpy.ceil((num - tolerance - t0) / dt)
+        else:
+            index = numpy.floor((num - t0) / dt + 0.5)
+        # NaNs fail this too
+        if not numpy.all((index >= 0) & (index < N)):
+            return None
+    index = index.astype(int)
+
+    # Unique and increasing, as netCDF variables want them
+    read = numpy.unique(numpy.clip(numpy.concatenate([index - 1, index, index + 1]), 0, N - 1))
+    values = numpy.ravel(numpy.asarray(nctime[read], dtype='d'))
+    here, previous, following = [values[numpy.searchsorted(read, numpy.clip(i, 0, N - 1))]
+                            for i in [index, index - 1, index + 1]]
+    first, last = index == 0, index == N - 1
+
+    if select == 'exact':
+        ok = numpy.abs(here - num) <= tolerance
+    elif select == 'before':
+        ok = (here <= num + tolerance) & (last | (following > num + tolerance))
     elif select == 'after':
-        index = numpy.array(numpy.ceil( (num-t0)/dt ), int)
+        ok = (here >= num - tolerance) & (first | (previous < num - tolerance))
     else:
-        index = numpy.array(numpy.around( (num-t0)/dt ), int)
+        ok = (first | (num >= (previous + here) / 2.)) & (last | (num < (here + following) / 2.))
+    if not numpy.all(ok):
+        return None
 
-    # Checking that the index really corresponds to the given date.
-    # If the times do not correspond, then it means that the times
-    # are not increasing uniformly and we try the bisection method.
-    if not _check_index(index, dates, nctime, calendar, select):
-        
-        # Use the bisection method. Assumes nctime is ordered.
-        import bisect
-        index = numpy.array([bisect.bisect_right(nctime, n) for n in num], int)
-        before = index == 0
-        
-        index = numpy.array([bisect.bisect_left(nctime, n) for n in num], int)
+    return index
+
+_SECONDS = {'second': 1., 'seconds': 1., 'minute': 60., 'minutes': 60.,
+            'hour': 3600., 'hours': 3600., 'day': 86400., 'days': 86400.}
+_MATCH_TOLERANCE = 1e-3 # seconds
+
+class TimeIndex(object):
+    """
+Reusable index over the values of a netCDF time variable, for repeated
+L{date2index} queries.
+
+To initialize: C{index = TimeIndex(nctime,calendar=None)}
+
+The values of C{nctime} (which must have a C{units} attribute and be stored
+in increasing order) are read into memory once.  If they are uniformly
+spaced, dates are located arithmetically, otherwise by binary search
+(C{numpy.searchsorted}), so each query costs O(log n) at most.
+    """
+
+    def __init__(self, nctime, calendar=None):
+        if calendar == None:
+            calendar = getattr(nctime, 'calendar', 'standard')
+        self.calendar = calendar
+        self.units = nctime.units
+        self.utime = _get_utime(self.units, calendar)
+        self.times = numpy.ravel(numpy.asarray(nctime[:], dtype='d'))
+        N = len(self.times)
+        # Uniform stride, checked once: dates can be located without searching
+        self.stride = None
+        if N > 1:
+            diffs = numpy.diff(self.times)
+            if diffs[0] > 0 and numpy.all(diffs == diffs[0]):
+                self.stride = diffs[0]
+        # date2num goes through Julian Days, which carry a rounding error of
+        # ~1e-4 seconds: values this close to a time step are matched to it.
+        self.tolerance = _MATCH_TOLERANCE / _SECONDS[self.utime.units]
+
+    def __len__(self):
+        return len(self.times)
+
+    def searchsorted(self, num):
+        """
+Return the indices (as C{numpy.searchsorted(times, num, 'left')}) at which
+the numeric times C{num} would be inserted into the time axis.
+        """
+        times = self.times
+        N = len(times)
+        num = numpy.atleast_1d(numpy.asarray(num, dtype='d'))
+        if self.stride is None:
+            return numpy.searchsorted(times, num, 'left')
+        with numpy.errstate(invalid='ignore'):
+            index = numpy.ceil((num - times[0]) / self.stride)
+            index = numpy.clip(numpy.nan_to_num(index), 0, N).astype(int)
+            # Rounding may leave a few indices one off: search for those
+            ok = ((index == 0) | (times[numpy.maximum(index - 1, 0)] < num)) & \
+                 ((index == N) | (times[numpy.minimum(index, N - 1)] >= num))
+        if not numpy.all(ok):
+            bad = ~ok
+            index[bad] = numpy.searchsorted(times, num[bad], 'left')
+        return index
+
+    def date2index(self, dates, select='exact'):
+        """
+Return indices of the time axis corresponding to the given dates, see
+L{date2index}.
+        """
+        if select not in ['exact', 'before', 'after', 'nearest']:
+            raise ValueError("%s is not an option for the `select` argument."%select)
+
+        times = self.times
+        N = len(times)
+        num = numpy.atleast_1d(numpy.asarray(self.utime.date2num(dates), dtype='d'))
+
+        index = self.searchsorted(num)
+        for neighbour in [numpy.maximum(index - 1, 0), numpy.minimum(index, N - 1)]:
+            close = numpy.abs(times[neighbour] - num) <= self.tolerance
+            num[close] = times[neighbour[close]]
+            index[close] = neighbour[close]
         after = index == N
-        
+        index[after] = N-1
+        ncnum = times[index]
+        match = ncnum == num
+        # before the first date, unless it is the first date
+        before = (index == 0) & ~match
+
         if select in ['before', 'exact'] and numpy.any(before):
             raise ValueError('At least one of the dates given is before the first date in `nctime`.')
-        
+
         if select in ['after', 'exact'] and numpy.any(after):
             raise ValueError('At least one of the dates given is after the last date in `nctime`.')
-            
-        
+
         # Find the dates for which the match is not perfect.
-        # Use list comprehension instead of the simpler `nctime[index]` since
-        # not all time objects support numpy integer indexing (eg dap).
-        index[after] = N-1
-        ncnum = numpy.squeeze([nctime[i] for i in index])
-        mismatch = numpy.nonzero(ncnum != num)[0]
-                   
+        mismatch = numpy.nonzero(~match)[0]
+
         if select == 'exact':
             if len(mismatch) > 0:
                 raise ValueError('Some of the dates specified were not found in the `nctime` variable.')
-   
+
         elif select == 'before':
             index[after] = N
             index[mismatch] -= 1
-               
-        elif select == 'after':
-            pass
-       
+
         elif select == 'nearest':
-            nearest_to_left = num[mismatch] < numpy.array( [nctime[i-1] + nctime[i] for i in index[mismatch]]) / 2.
+            previous = times[numpy.maximum(index[mismatch] - 1, 0)]
+            nearest_to_left = num[mismatch] < (previous + times[index[mismatch]]) / 2.
             index[mismatch] = index[mismatch] - 1 * nearest_to_left
-       
-        else:
-            raise ValueError("%s is not an option for the `select` argument."%select)
-   
 
         # Correct for indices equal to -1
         index[before] = 0
-        
-    # convert numpy scalars or single element arrays to python ints.
-    return _toscalar(index)
 
+        # convert numpy scalars or single element arrays to python ints.
+        return _toscalar(index)
 
 def _toscalar(a):
     if a.shape in [(),(1,)]:
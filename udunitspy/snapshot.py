@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+"""
+@package udunitspy.snapshot
+@file udunitspy/snapshot.py
+@author Christopher Mueller
+@brief Precompiled snapshots of a udunits2 XML unit database
+
+A snapshot holds everything the Python side derives from the XML database:
+the unit names, plurals, symbols and aliases, the base units and the
+dimension index (see udunits2.DimensionIndex).  System.dimension_index loads
+it instead of re-reading the XML with ElementTree and re-parsing every unit,
+as long as none of the XML files it was built from has changed size or
+modification time since.  Snapshots written anywhere but the default
+location are passed to System as System(path, snapshot=SNAPSHOT).
+
+Only the dimension index is sped up: System startup itself is unchanged, the
+C-level ut_system is still built by ut_read_xml() (the udunits2 API has no
+way to serialize a unit system).
+
+Usage:
+    python -m udunitspy.snapshot [-o SNAPSHOT] [--benchmark] [xml_path]
+"""
+
+import argparse
+import os
+import sys
+import time
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+# Bumped whenever the layout of the pickled data changes
+SNAPSHOT_VERSION = 2
+
+def _source_stat(path):
+    # Compared exactly rather than against the snapshot's own mtime: an edit
+    # within the filesystem's timestamp granularity still changes the size
+    # or the mtime
+    st = os.stat(path)
+    return st.st_size, st.st_mtime
+
+def snapshot_path(path):
+    """Default location of the snapshot for the XML database at 'path'."""
+    return os.path.realpath(path) + '.snapshot'
+
+def compile_snapshot(path, dst=None, system=None):
+    """Compile the XML database at 'path' (and everything it imports) into a
+    snapshot written to 'dst' (default: snapshot_path(path)).
+
+    Returns the path of the snapshot.
+    """
+    from udunitspy.udunits2 import System, DimensionIndex, _read_unit_names
+
+    system = system or System(path=path)
+    sources = []
+    names, base_units = _read_unit_names(path, sources)
+    index = DimensionIndex(system, names=names, base_units=base_units)
+
+    data = {
+        'version': SNAPSHOT_VERSION,
+        'sources': [(source, _source_stat(source)) for source in sources],
+        'base_units': index.base_units,
+        'entries': dict((name, tuple(entry)) for name, entry in index.entries.items()),
+    }
+
+    dst = dst or snapshot_path(path)
+    tmp = '{0}.{1}.tmp'.format(dst, os.getpid())
+    with open(tmp, 'wb') as f:
+        pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+    # Readers never see a partially written snapshot
+    os.rename(tmp, dst)
+
+    return dst
+
+def load_snapshot(path, src=None):
+    """Load the snapshot of the XML database at 'path' from 'src' (default:
+    snapshot_path(path)).
+
+    Returns None if there is no snapshot, it can't be read, or any of the XML
+    files it was built from has been modified since.
+    """
+    src = src or snapshot_path(path)
+    try:
+        with open(src, 'rb') as f:
+            data = pickle.load(f)
+    except Exception:
+        return None
+
+    if not isinstance(data, dict) or data.get('version') != SNAPSHOT_VERSION:
+        return None
+    try:
+        if any(_source_stat(source) != tuple(stat) for source, stat in data['sources']):
+            return None
+    except OSError:
+        return None
+
+    return data
+
+def benchmark(path, repeat=5, src=None):
+    """Time the dimension index construction of the database at 'path' from
+    the XML and from its snapshot 'src' (default: snapshot_path(path)), next
+    to System startup, which the snapshot does not change.  Returns a dict of
+    best times in seconds.
+    """
+    from udunitspy.udunits2 import System, DimensionIndex
+
+    def best(func):
+        times = []
+        for _ in xrange(repeat):
+            start = time.time()
+            func()
+            times.append(time.time() - start)
+        return min(times)
+
+    if load_snapshot(path, src) is None:
+        compile_snapshot(path, src)
+
+    def from_snapshot():
+        data = load_snapshot(path, src)
+        DimensionIndex(system, base_units=data['base_units'], entries=data['entries'])
+
+    system = System(path=path)
+    return {
+        'system_startup': best(lambda: System(path=path)),
+        'index_from_xml': best(lambda: DimensionIndex(system)),
+        'index_from_snapshot': best(from_snapshot),
+    }
+
+def main(argv=None):
+    from udunitspy.udunits2 import DEFAULT_UDUNITS_PATH
+
+    parser = argparse.ArgumentParser(description='Compile a udunits2 XML database into a snapshot')
+    parser.add_argument('path', nargs='?', default=DEFAULT_UDUNITS_PATH,
+                        help='udunits2.xml to compile (default: %(default)s)')
+    parser.add_argument('-o', '--output', default=None, help='snapshot file (default: <path>.snapshot)')
+    parser.add_argument('--benchmark', action='store_true', help='time loading with and without the snapshot')
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        for name, seconds in sorted(benchmark(args.path, src=args.output).items()):
+            print('{0:<20} {1:10.3f} ms'.format(name, seconds * 1000))
+    else:
+        print(compile_snapshot(args.path, args.output))
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
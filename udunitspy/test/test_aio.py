@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+"""
+@package udunitspy.test.test_aio
+@file udunitspy/test/test_aio.py
+@author Christopher Mueller
+@brief
+"""
+
+import sys
+import pytest
+
+if sys.version_info < (3, 5):
+    pytest.skip('udunitspy.aio needs Python 3.5+', allow_module_level=True)
+
+import asyncio
+import numpy as np
+from udunitspy import aio
+from udunitspy.udunits2 import Unit, System, Converter, DEFAULT_UDUNITS_PATH
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+class TestAio:
+
+    def test_load_system(self):
+        s = run(aio.load_system(DEFAULT_UDUNITS_PATH))
+        assert isinstance(s, System)
+        assert Unit('m', system=s).get_converter('ft')(1.0) == pytest.approx(1 / 0.3048)
+
+    def test_get_converter(self):
+        conv = run(aio.get_converter('m', Unit('ft')))
+        assert isinstance(conv, Converter)
+        assert conv(1.0) == pytest.approx(1 / 0.3048)
+        assert run(aio.get_converter('m', 's')) is None
+
+    def test_convert(self):
+        conv = Converter(scale=2.0, offset=1.0)
+        assert run(aio.convert(conv, 3.0)) == 7.0
+        assert run(aio.convert(conv, [1.0, 2.0])).tolist() == [3.0, 5.0]
+
+        x = np.arange(100000.)
+        np.testing.assert_array_equal(run(aio.convert(conv, x, chunk_size=1000)), 2 * x + 1)
+        np.testing.assert_array_equal(run(aio.convert(conv, x.astype(int), chunk_size=1000)), 2 * x + 1)
+
+        # Into 'out', and a non-contiguous array with long rows
+        x = x.reshape(1000, 100).T
+        out = np.empty_like(x)
+        assert run(aio.convert(conv, x, out=out, chunk_size=10)) is out
+        np.testing.assert_array_equal(out, 2 * x + 1)
+
+        # Chunks are bounded whatever the layout
+        blocks = []
+        convert_block = aio._convert_block
+        def record(converter, value, result, block):
+            blocks.append(block.stop - block.start)
+            convert_block(converter, value, result, block)
+        aio._convert_block = record
+        try:
+            out = run(aio.convert(conv, np.ones((2, 50000)).T, chunk_size=1000))
+        finally:
+            aio._convert_block = convert_block
+        assert max(blocks) == 1000 and len(blocks) == 100
+        np.testing.assert_array_equal(out, 3.)
+
+        # Same dtype as Converter.evaluate
+        x = np.arange(1., 100001., dtype=np.float32)[::2]
+        assert run(aio.convert(Converter(base=10), x)).dtype == Converter(base=10)(x).dtype == np.float32
+
+        with pytest.raises(ValueError):
+            run(aio.convert(conv, x, out=np.empty(5)))
+        with pytest.raises(TypeError):
+            run(aio.convert(None, x))
+
+    def test_yields(self):
+        # Other callbacks keep running while a large array is converted
+        conv = Converter(scale=2.0)
+        loop = asyncio.new_event_loop()
+        ticks = []
+
+        def tick():
+            ticks.append(None)
+            loop.call_soon(tick)
+
+        try:
+            loop.call_soon(tick)
+            ret = loop.run_until_complete(aio.convert(conv, np.ones(1000000), chunk_size=10000))
+        finally:
+            loop.close()
+
+        assert ret.sum() == 2000000
+        assert len(ticks) > 1
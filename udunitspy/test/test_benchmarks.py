@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+"""
+@package udunitspy.test.test_benchmarks
+@file udunitspy/test/test_benchmarks.py
+@author Christopher Mueller
+@brief
+"""
+
+from collections import OrderedDict
+from udunitspy.benchmarks import harness, main, BENCHMARKS
+
+class TestHarness:
+
+    def setup_method(self, method):
+        self.min_round_time = harness.MIN_ROUND_TIME
+        harness.MIN_ROUND_TIME = 0.001
+
+    def teardown_method(self, method):
+        harness.MIN_ROUND_TIME = self.min_round_time
+
+    def test_time_callable(self):
+        calls = []
+        stats = harness.time_callable(lambda: calls.append(1), rounds=3)
+        assert stats['rounds'] == 3
+        assert stats['min'] <= stats['median'] <= stats['max']
+        # Calibration plus the timed rounds
+        assert len(calls) > 3 * stats['loops']
+
+    def test_run_and_compare(self, tmpdir):
+        registry = OrderedDict()
+        harness.BENCHMARKS, saved = registry, harness.BENCHMARKS
+        try:
+            @harness.benchmark('noop')
+            def bench_noop():
+                return lambda: None
+
+            @harness.benchmark('sum', params=[10, 1000])
+            def bench_sum(size):
+                values = range(size)
+                return lambda: sum(values)
+        finally:
+            harness.BENCHMARKS = saved
+
+        assert list(registry) == ['noop', 'sum[10]', 'sum[1000]']
+        results = harness.run(rounds=2, max_elements=100, benchmarks=registry)
+        assert list(results['benchmarks']) == ['noop', 'sum[10]']
+        assert results['benchmarks']['sum[10]']['elements'] == 10
+        assert 'python' in results['machine']
+
+        path = str(tmpdir.join('baseline.json'))
+        harness.save(results, path)
+        baseline = harness.load(path)
+        assert baseline['benchmarks']['noop']['loops'] == results['benchmarks']['noop']['loops']
+
+        baseline['benchmarks']['noop']['min'] /= 2
+        baseline['benchmarks']['sum[10]']['min'] *= 2
+        baseline['benchmarks']['gone'] = {'min': 1.0}
+        statuses = dict((row[0], row[4]) for row in harness.compare(results, baseline))
+        assert statuses == {'noop': 'regression', 'sum[10]': 'improvement', 'gone': 'missing'}
+        assert 'regression' in harness.format_comparison(harness.compare(results, baseline))
+
+    def test_suites(self, tmpdir):
+        assert 'convert_array[100000000]' in BENCHMARKS
+        assert 'date2index[1000]' in BENCHMARKS
+
+        path = str(tmpdir.join('results.json'))
+        assert main(['-k', r'^num2date_datetime64\[10\]$', '--rounds', '1', '--json', path]) == 0
+        assert list(harness.load(path)['benchmarks']) == ['num2date_datetime64[10]']
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+"""
+@package udunitspy.test.test_cache
+@file udunitspy/test/test_cache.py
+@author Christopher Mueller
+@brief 
+"""
+
+from udunitspy.cache import LRUCache
+
+class TestLRUCache:
+
+    def test_get_put(self):
+        c = LRUCache(2)
+        assert c.get('a') is None
+        c.put('a', 1)
+        c.put('b', 2)
+        assert c.get('a') == 1
+
+        # 'b' is now the least recently used entry
+        c.put('c', 3)
+        assert 'b' not in c
+        assert 'a' in c and 'c' in c
+
+        assert c.stats() == {'hits': 1, 'misses': 1, 'evictions': 1, 'size': 2, 'capacity': 2}
+
+    def test_get_or_create(self):
+        c = LRUCache(4)
+        calls = []
+        def factory():
+            calls.append(1)
+            return 'value'
+
+        assert c.get_or_create('k', factory) == 'value'
+        assert c.get_or_create('k', factory) == 'value'
+        assert len(calls) == 1
+
+    def test_capacity(self):
+        c = LRUCache(4)
+        for i in range(4):
+            c.put(i, i)
+
+        c.capacity = 1
+        assert len(c) == 1
+        assert 3 in c
+        assert c.stats()['evictions'] == 3
+
+        c.capacity = 0
+        c.put('x', 1)
+        assert len(c) == 0
+
+    def test_clear(self):
+        c = LRUCache(4)
+        c.put('a', 1)
+        c.get('a')
+        c.clear()
+        assert len(c) == 0
+        assert c.stats()['hits'] == 0
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+"""
+@package udunitspy.test.test_instrumentation
+@file udunitspy/test/test_instrumentation.py
+@author Christopher Mueller
+@brief
+"""
+
+import udunitspy
+from udunitspy import instrumentation
+from udunitspy.udunits2 import ut, Unit, Converter
+import numpy as np
+
+class TestInstrumentation:
+
+    def teardown_method(self, method):
+        instrumentation.disable()
+        instrumentation.reset()
+
+    def test_disabled(self):
+        parse = ut.parse_status
+        Unit('m').get_converter('ft')([1.0, 2.0])
+        assert udunitspy.stats() == {}
+        assert not instrumentation.is_enabled()
+        assert ut.parse_status is parse
+
+    def test_stats(self):
+        calls = []
+        instrumentation.enable(callback=lambda *args: calls.append(args))
+        assert instrumentation.is_enabled()
+
+        conv = Converter(base=10)
+        conv(np.arange(1.0, 1001.0))
+        conv([1.0, 10.0, 100.0])
+        conv(5.0)
+
+        stats = udunitspy.stats()
+        # The list goes through a float64 copy, converted by the C code too
+        assert stats['ut.cv_convert_buffer']['elements'] == 1003
+        assert stats['ut.cv_convert_double']['count'] == 1
+        assert stats['Converter._evaluate']['elements'] == 3
+        assert stats['Converter._convert_copy']['count'] == 1
+        for op in stats.values():
+            assert op['count'] > 0
+            assert 0 <= op['p50'] <= op['p90'] <= op['p99'] <= op['max'] <= op['total']
+
+        assert len(calls) == sum(op['count'] for op in stats.values())
+        assert set(call[0] for call in calls) == set(stats)
+
+        instrumentation.disable()
+        conv([1.0, 2.0])
+        assert udunitspy.stats(reset=True)['Converter._evaluate']['count'] == 1
+        assert udunitspy.stats() == {}
+
+    def test_callback_errors(self):
+        def fail(name, seconds, elements):
+            raise RuntimeError(name)
+
+        instrumentation.enable(callback=fail)
+        assert Converter(scale=2.0)(3.0) == 6.0
+        assert udunitspy.stats()['ut.cv_convert_double']['count'] == 1
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+
+"""
+@package udunitspy.test.test_netcdftime
+@file udunitspy/test/test_netcdftime.py
+@author Christopher Mueller
+@brief
+"""
+
+import numpy as np
+import pickle
+import pytest
+from datetime import datetime as real_datetime
+from udunitspy.netcdftime import utime, datetime, date2num, num2date, date2index, TimeIndex, CalendarDateArray, DATE_FIELDS_DTYPE, UTIME_CACHE, _calendars, DateFromJulianDay, _DateFieldsFromJulianDay
+
+class TestUtimeVectorized:
+
+    def _fields(self, calendar, n=500):
+        rng = np.random.RandomState(0)
+        fields = [rng.randint(1, 3000, n), rng.randint(1, 13, n), rng.randint(1, 29, n),
+                  rng.randint(0, 24, n), rng.randint(0, 60, n), rng.randint(0, 60, n)]
+        if calendar in ['standard', 'gregorian']:
+            # Skip the month containing the julian/gregorian gap
+            ok = ~((fields[0] == 1582) & (fields[1] == 10))
+            fields = [f[ok] for f in fields]
+        return fields
+
+    def test_fields2num(self):
+        for calendar in _calendars:
+            t = utime('hours since 1900-01-01 06:00 +02:00', calendar)
+            fields = self._fields(calendar)
+            expected = [t.date2num(datetime(*f)) for f in zip(*fields)]
+            np.testing.assert_array_equal(t.fields2num(*fields), expected)
+
+    def test_fields2num_invalid(self):
+        for calendar, date in [('noleap', (2001, 2, 29)), ('360_day', (2001, 1, 31)),
+                               ('standard', (1582, 10, 10))]:
+            t = utime('days since 2000-01-01', calendar)
+            with pytest.raises(ValueError):
+                t.fields2num(*date)
+
+    def test_date2num_datetime64(self):
+        t = utime('seconds since 1970-01-01')
+        dates = np.arange('1999-12-30', '2000-01-02', dtype='M8[h]')
+        expected = (dates - np.datetime64('1970-01-01')).astype('m8[s]').astype(float)
+        np.testing.assert_allclose(t.date2num(dates), expected, atol=1e-3)
+        np.testing.assert_allclose(t.date2num(dates.astype(object)), expected, atol=1e-3)
+
+        # Missing values
+        ret = t.date2num(np.array(['2000-01-01', 'NaT'], dtype='M8[ms]'))
+        assert ret[0] == 946684800.0 and np.isnan(ret[1])
+
+        # Scalars
+        assert abs(t.date2num(np.datetime64('2000-01-01T00:00:00.5')) - 946684800.5) < 1e-3
+
+    def test_num2date_fields(self):
+        for calendar in _calendars:
+            t = utime('hours since 1900-01-01 06:00 +02:00', calendar)
+            values = np.arange(0., 5e5, 97.25)
+            fields = t.num2date(values, as_fields=True)
+            assert fields.dtype == DATE_FIELDS_DTYPE
+            expected = [(d.year, d.month, d.day, d.hour, d.minute, d.second) for d in t.num2date(values)]
+            assert fields.tolist() == expected
+
+    def test_num2date_fields_early_years(self):
+        # Proleptic gregorian dates before year 400 (negative Meeus alpha)
+        t = utime('days since 0001-01-01', 'proleptic_gregorian')
+        values = np.arange(0., 200000., 7.)
+        expected = [real_datetime.fromordinal(int(v) + 1).timetuple()[:6] for v in values]
+        assert t.num2date(values, as_fields=True).tolist() == expected
+        assert [d.timetuple()[:6] for d in t.num2date(values)] == expected
+        assert [d.timetuple()[:6] for d in CalendarDateArray.from_num(values, t.unit_string, t.calendar)] == expected
+
+        assert _DateFieldsFromJulianDay(np.array([1756477.80]), 'proleptic_gregorian').tolist()[0][:3] == (96, 12, 20)
+        date = DateFromJulianDay(1756477.80, 'proleptic_gregorian')
+        assert (date.year, date.month, date.day) == (96, 12, 20)
+
+    def test_num2date_datetime64(self):
+        t = utime('hours since 2000-01-01 00:00 -06:00')
+        values = np.ma.array([0., 1.5, 48.], mask=[0, 1, 0])
+        dates = t.num2date(values, as_datetime64=True)
+        assert dates.dtype == np.dtype('M8[s]')
+        assert dates[0] == np.datetime64('2000-01-01T06:00:00')
+        assert np.isnat(dates[1])
+        assert dates[2] == np.datetime64('2000-01-03T06:00:00')
+        assert t.num2date(3., as_datetime64=True) == np.datetime64('2000-01-01T09:00:00')
+
+        # Round trip
+        np.testing.assert_allclose(t.date2num(t.num2date(np.arange(0., 1e4, 0.5), as_datetime64=True)),
+                                   np.arange(0., 1e4, 0.5), atol=1e-6)
+
+        # Masked fields
+        fields = t.num2date(values, as_fields=True)
+        assert fields.mask.tolist()[1] == (True,) * 6
+        assert fields[0].tolist() == (2000, 1, 1, 6, 0, 0)
+
+        # Non-real calendars fall back to fields
+        fields = utime('days since 2000-01-01', '360_day').num2date([29.5, 360.], as_datetime64=True)
+        assert fields.tolist() == [(2000, 1, 30, 12, 0, 0), (2001, 1, 1, 0, 0, 0)]
+
+        # Julian dates
+        with pytest.raises(ValueError):
+            utime('days since 1500-01-01').num2date([0.], as_datetime64=True)
+
+class _TimeVariable(np.ndarray):
+    pass
+
+def _time_variable(values, units, calendar='standard'):
+    var = np.asarray(values, dtype='d').view(_TimeVariable)
+    var.units = units
+    var.calendar = calendar
+    return var
+
+class _CountingVariable(object):
+    # Time variable recording how many values are read from it
+    def __init__(self, nctime):
+        self.nctime = nctime
+        self.units = nctime.units
+        self.calendar = nctime.calendar
+        self.read = 0
+
+    def __len__(self):
+        return len(self.nctime)
+
+    def __getitem__(self, item):
+        values = np.asarray(self.nctime)[item]
+        self.read += np.size(values)
+        return values
+
+class TestDate2Index:
+
+    def _check(self, nctime):
+        index = TimeIndex(nctime)
+        t = utime(nctime.units, nctime.calendar)
+        dates = t.num2date(nctime[[0, 3, 7]])
+        assert index.date2index(list(dates)).tolist() == [0, 3, 7]
+        assert date2index(dates[1], nctime) == 3
+
+        # Halfway between steps 3 and 4, a little before and after
+        mid = (nctime[3] + nctime[4]) / 2.
+        for offset, nearest in [(-1, 3), (1, 4)]:
+            date = t.num2date(mid + offset)
+            assert index.date2index(date, select='before') == 3
+            assert index.date2index(date, select='after') == 4
+            assert index.date2index(date, select='nearest') == nearest
+
+        # Out of range
+        first, last = t.num2date(nctime[0] - 1), t.num2date(nctime[-1] + 1)
+        assert index.date2index(first, select='after') == 0
+        assert index.date2index(first, select='nearest') == 0
+        assert index.date2index(last, select='before') == len(nctime) - 1
+        assert index.date2index(last, select='nearest') == len(nctime) - 1
+        for date, select in [(first, 'exact'), (first, 'before'), (last, 'exact'), (last, 'after'),
+                             (t.num2date(mid), 'exact')]:
+            with pytest.raises(ValueError):
+                index.date2index(date, select=select)
+
+    def test_uniform(self):
+        nctime = _time_variable(np.arange(0., 6000., 6.), 'hours since 2000-01-01 00:00')
+        assert TimeIndex(nctime).stride == 6.
+        self._check(nctime)
+
+        # The one-shot function reads a few values around each index only,
+        # and agrees with TimeIndex
+        rng = np.random.RandomState(0)
+        t = utime(nctime.units)
+        values = np.concatenate([nctime[[0, 5, 999]], rng.uniform(nctime[0], nctime[-1], 20),
+                                 (nctime[:-1:100] + nctime[1::100]) / 2.])
+        dates = t.num2date(values)
+        for select in ['before', 'after', 'nearest']:
+            counting = _CountingVariable(nctime)
+            assert date2index(dates, counting, select=select).tolist() == \
+                TimeIndex(nctime).date2index(dates, select=select).tolist()
+            assert counting.read <= 2 + 3 * len(dates)
+        counting = _CountingVariable(nctime)
+        assert date2index(dates[:3], counting).tolist() == [0, 5, 999]
+        assert counting.read <= 2 + 9
+
+        # Floating point error in date2num
+        nctime = _time_variable(np.arange(0., 6e8, 60.), 'seconds since 1990-01-01')
+        dates = np.arange('1990-01-01', '1991-01-01', dtype='M8[h]')
+        assert date2index(dates, nctime).tolist() == list(range(0, 8760 * 60, 60))
+
+    def test_irregular(self):
+        rng = np.random.RandomState(0)
+        nctime = _time_variable(np.cumsum(rng.randint(3, 50, 300)), 'hours since 2000-01-01', 'noleap')
+        assert TimeIndex(nctime).stride is None
+        self._check(nctime)
+
+        values = rng.uniform(nctime[0], nctime[-1], 100).round()
+        expected = np.searchsorted(nctime, values, 'right') - 1
+        dates = utime(nctime.units, 'noleap').num2date(values)
+        assert date2index(list(dates), nctime, select='before').tolist() == expected.tolist()
+
+class TestUtimeCache:
+
+    def test_cache(self):
+        UTIME_CACHE.clear()
+        for i in range(10):
+            num2date(i, 'hours since 2000-01-01', 'noleap')
+            date2num(datetime(2000, 1, 1), 'hours since 2000-01-01', 'noleap')
+        num2date(0, 'hours since 2000-01-01')
+
+        assert UTIME_CACHE.stats()['misses'] == 2
+        assert UTIME_CACHE.stats()['hits'] == 19
+        assert UTIME_CACHE.stats()['size'] == 2
+
+        # Invalid units are not cached
+        with pytest.raises(ValueError):
+            num2date(0, 'fortnights since 2000-01-01')
+        assert len(UTIME_CACHE) == 2
+
+class TestDatetime:
+
+    def test_compare(self):
+        d = datetime(2000, 2, 30, 12)
+        assert d == datetime(2000, 2, 30, 12)
+        assert d != datetime(2000, 2, 30, 13)
+        assert datetime(2000, 2, 29) < d < datetime(2000, 3, 1)
+        assert sorted([datetime(2000, 3, 1), d, datetime(1999, 12, 30)]) == \
+            [datetime(1999, 12, 30), d, datetime(2000, 3, 1)]
+        assert len(set([d, datetime(2000, 2, 30, 12), datetime(2000, 1, 1)])) == 2
+
+        # Against real datetimes
+        assert d > real_datetime(2000, 2, 28)
+        assert real_datetime(2000, 2, 28) < d
+        assert datetime(2000, 1, 1) == real_datetime(2000, 1, 1)
+        assert (d == 5) is False
+
+        # Equal dates hash alike, whichever the type
+        dates = {real_datetime(2000, 1, 1): 'real', datetime(2000, 2, 30): '360_day'}
+        assert dates[datetime(2000, 1, 1)] == 'real'
+        assert real_datetime(2000, 1, 1, 0, 0, 1, 500000) in set([datetime(2000, 1, 1, 0, 0, 1.5)])
+        assert datetime(2000, 1, 1, 0, 0, 1) != real_datetime(2000, 1, 1, 0, 0, 1, 500000)
+        assert dates[datetime(2000, 2, 30)] == '360_day'
+
+    def test_format(self):
+        d = datetime(2000, 2, 30, 12, 5, 7, dayofyr=60)
+        assert not hasattr(d, '__dict__')
+        assert str(d) == '2000-02-30 12:05:07'
+        assert str(datetime(1, 1, 1)) == '   1-01-01 00:00:00'
+        assert d.strftime('%Y%j {%%}') == '2000060 {%}'
+        # Falls back to time.strftime for the other directives
+        assert d.strftime('%y %b') == '00 Feb'
+
+        d.format = '%Y'
+        assert repr(d) == '2000'
+        clone = pickle.loads(pickle.dumps(d))
+        assert clone == d and repr(clone) == '2000'
+
+class TestCalendarDateArray:
+
+    def test_num(self):
+        values = np.arange(0., 3 * 36000.)
+        dates = CalendarDateArray.from_num(values, 'days since 1900-01-01', '360_day')
+        assert len(dates) == len(values)
+        assert dates.calendar == '360_day'
+        assert dates[30] == datetime(1900, 2, 1)
+        assert dates.year.dtype == np.int32 and dates.year.flags.c_contiguous
+        np.testing.assert_array_equal(dates.to_num('days since 1900-01-01'), values)
+        np.testing.assert_array_equal(dates.to_num('hours since 1900-01-02')[:2], [-24., 0.])
+
+        fields = dates.to_fields()
+        assert fields.dtype == DATE_FIELDS_DTYPE
+        assert CalendarDateArray.from_fields(fields, '360_day')[100] == dates[100]
+
+        masked = utime('days since 1900-01-01').num2date(np.ma.array([0., 1.], mask=[0, 1]), as_fields=True)
+        with pytest.raises(ValueError):
+            CalendarDateArray.from_fields(masked)
+
+    def test_compare_sort(self):
+        dates = CalendarDateArray([2000, 1999, 2000, 2000], [2, 12, 2, 1], [30, 1, 29, 30], calendar='360_day')
+        assert (dates == datetime(2000, 2, 30)).tolist() == [True, False, False, False]
+        assert (dates < datetime(2000, 2, 1)).tolist() == [False, True, False, True]
+        assert (dates >= dates[2]).tolist() == [True, False, True, False]
+        assert (dates[1:3] != dates[:2]).tolist() == [True, True]
+        assert dates.argsort().tolist() == [1, 3, 2, 0]
+
+        dates.sort()
+        assert [str(d) for d in dates] == ['1999-12-01 00:00:00', '2000-01-30 00:00:00',
+                                           '2000-02-29 00:00:00', '2000-02-30 00:00:00']
+
+        other = CalendarDateArray.from_dates(list(dates), 'noleap')
+        with pytest.raises(ValueError):
+            dates < other
+
+    def test_strftime(self):
+        dates = CalendarDateArray.from_num(np.arange(0., 400.), 'days since 0999-12-31 12:00', 'noleap')
+        expected = [str(d) for d in dates]
+        assert dates.strftime().tolist() == expected
+        assert dates[[0, 1, 60]].strftime('%j/%Y %%').tolist() == ['365/ 999 %', '001/1000 %', '060/1000 %']
+        assert dates[[1]].strftime('%b').tolist() == ['Jan']
+        assert CalendarDateArray([12345], [1], [1]).strftime('%Y').tolist() == ['12345']
+        assert CalendarDateArray(2000, 1, 1).strftime().shape == ()
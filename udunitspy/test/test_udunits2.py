@@ -7,9 +7,18 @@
 @brief 
 """
 
-from udunitspy.udunits2 import Unit, System, DEFAULT_SYSTEM, DEFAULT_UDUNITS_PATH, UdunitsError, Converter
+from udunitspy.udunits2 import Unit, System, DEFAULT_SYSTEM, DEFAULT_UDUNITS_PATH, UdunitsError, Converter, CONVERTER_CACHE, PARALLEL_THRESHOLD, get_default_system, warm_caches
+from udunitspy.udunits2_c import compare as ut_compare, UT_ASCII
+from udunitspy.convert import convert_file, main as convert_main
+from udunitspy.snapshot import compile_snapshot, load_snapshot, snapshot_path, main as snapshot_main
+from udunitspy.netcdftime import utime
 import numpy as np
 import pytest
+import datetime
+import os
+import pickle
+import multiprocessing
+import threading
 
 class TestUdunits2Unit:
 
@@ -108,6 +117,26 @@ class TestUdunits2Unit:
         assert m/100 == Unit('cm')
         assert str(-m) == '-1 m'
 
+    def test_timestamp(self):
+        hours = Unit('hours since 2000-01-01')
+        assert hours.is_timestamp()
+        assert not Unit('hours').is_timestamp()
+        assert Unit('hours').offset_by_time(datetime.datetime(2000, 1, 1)) == hours
+
+        noleap = Unit('days since 2000-01-01', calendar='noleap')
+        assert noleap.calendar == 'noleap'
+        assert noleap.copy().calendar == 'noleap'
+        assert noleap.are_convertible(Unit('hours since 1900-01-01', calendar='365_day')) == False
+        assert noleap.are_convertible(Unit('hours since 1900-01-01', calendar='noleap')) == True
+        assert Unit('m', calendar='noleap').are_convertible('ft') == True
+
+        with pytest.raises(ValueError):
+            Unit('days since 2000-01-01', calendar='lunar')
+
+        # The calendar is part of the unit
+        assert noleap != Unit('days since 2000-01-01')
+        assert noleap == Unit('days since 2000-01-01', calendar='noleap')
+
     def test_same_system(self):
         assert Unit('m').same_system(Unit('ft'))
 
@@ -198,6 +227,154 @@ class TestUdunits2Converter:
         np.testing.assert_almost_equal(lb2g(inarr2[:,1,2]), 3175.144, decimal=3)
 
 
+    def test_convert_native_buffer(self):
+        m2ft = Converter('m', 'ft')
+        expected = np.array([9.186352, 11.48294, 62.992128, 1023.62208])
+
+        for dtype in (np.float64, np.float32):
+            inarr = np.array([2.8, 3.5, 19.2, 312], dtype=dtype)
+            outarr = m2ft(inarr)
+            assert outarr.dtype == dtype
+            np.testing.assert_array_almost_equal(outarr, expected, decimal=3)
+            # The input is left untouched
+            np.testing.assert_array_equal(inarr, np.array([2.8, 3.5, 19.2, 312], dtype=dtype))
+
+        # Convert into a preallocated array
+        inarr = np.array([2.8, 3.5, 19.2, 312])
+        out = np.empty_like(inarr)
+        assert m2ft.evaluate(inarr, out=out) is out
+        np.testing.assert_array_almost_equal(out, expected, decimal=6)
+
+        # ...or in place
+        assert m2ft(inarr, out=inarr) is inarr
+        np.testing.assert_array_almost_equal(inarr, expected, decimal=6)
+
+        # Non-contiguous input falls back to the general path
+        inarr = np.array([2.8, 0, 3.5, 0, 19.2, 0, 312, 0])[::2]
+        np.testing.assert_array_almost_equal(m2ft(inarr), expected, decimal=6)
+
+    def test_general_path(self):
+        # Input the C buffer conversion can't take as-is (lists, integers,
+        # strided arrays) gets exactly the same results
+        x = np.linspace(1, 1000, 200)
+        for conv in (Converter(base=10), Converter(power=10), Converter(inverse=True), Converter('lb', 'g')):
+            expected = conv(x)
+            np.testing.assert_array_equal(conv(list(x)), expected)
+            np.testing.assert_array_equal(conv(np.repeat(x, 2)[::2]), expected)
+            np.testing.assert_array_equal(conv(np.arange(1, 11)), conv(np.arange(1., 11.)))
+
+        # Non-affine converters convert a float64 copy with the C converter,
+        # affine ones never need to
+        log10 = Converter(base=10)
+        np.testing.assert_array_equal(log10([1, 100, 1e6]), [0.0, 2.0, 6.0])
+
+        lb2g = Converter('lb', 'g')
+        lb2g._convert_copy = None
+        np.testing.assert_array_almost_equal(lb2g([1, 2]), [453.592, 907.184], decimal=3)
+
+    def test_float32(self):
+        # float32 stays float32 on the C and numpy paths alike
+        x = np.arange(1, 21, dtype=np.float32)
+        for conv in (Converter('m', 'ft'), Converter(base=10)):
+            for value in (x, x[::2], x.reshape(4, 5).T):
+                ret = conv(value)
+                assert ret.dtype == np.float32
+                np.testing.assert_allclose(ret, conv(value.astype(np.double)), rtol=1e-6)
+
+        assert Converter('m', 'ft')([1, 2]).dtype == np.double
+
+    def test_affine_coefficients(self):
+        assert Converter(trivial=True).coefficients == (1.0, 0.0)
+        assert Converter(scale=2.5).coefficients == (2.5, 0.0)
+        assert Converter(offset=-3).coefficients == (1.0, -3.0)
+        assert Converter(scale=1.8, offset=32).coefficients == (1.8, 32.0)
+        assert Converter(inverse=True).coefficients is None
+        assert Converter(base=10).coefficients is None
+        assert Converter(power=10).coefficients is None
+
+        scale, offset = Converter('m', 'ft').coefficients
+        np.testing.assert_almost_equal(scale, 3.280839895, decimal=9)
+        assert offset == 0.0
+
+        scale, offset = Converter('degC', 'K').coefficients
+        np.testing.assert_almost_equal(scale, 1.0, decimal=12)
+        np.testing.assert_almost_equal(offset, 273.15, decimal=12)
+
+        # Lists and integer arrays go through the multiply-add fast path
+        c2f = Converter('degC', 'degF')
+        np.testing.assert_array_almost_equal(c2f([0, 100]), [32.0, 212.0], decimal=9)
+        out = np.empty(2)
+        assert c2f(np.array([0, 100]), out=out) is out
+        np.testing.assert_array_almost_equal(out, [32.0, 212.0], decimal=9)
+
+        # The general path stays in place for non-affine converters
+        log10 = Converter(base=10)
+        np.testing.assert_array_almost_equal(log10([1, 10, 100]), [0.0, 1.0, 2.0])
+
+    def test_convert_iter(self):
+        m2ft = Converter('m', 'ft')
+        chunks = (np.arange(i, i + 4, dtype=np.float64) for i in range(0, 12, 4))
+
+        out = list(m2ft.convert_iter(chunks))
+        assert len(out) == 3
+        np.testing.assert_array_almost_equal(np.concatenate(out), np.arange(12) * 3.280839895, decimal=6)
+
+        # Single element blocks are not squeezed
+        out = list(m2ft.convert_iter([[1.0]]))
+        assert out[0].shape == (1,)
+
+    def test_convert_chunked(self, tmpdir):
+        lb2g = Converter('lb', 'g')
+        inarr = np.arange(30, dtype=np.float64).reshape(10, 3)
+        expected = inarr * 453.59237
+
+        np.testing.assert_array_almost_equal(lb2g.convert_chunked(inarr, chunk_size=4), expected, decimal=3)
+
+        # Integer input, float64 output
+        outarr = lb2g.convert_chunked(inarr.astype(int), chunk_size=7)
+        assert outarr.dtype == np.float64
+        np.testing.assert_array_almost_equal(outarr, expected, decimal=3)
+
+        # Memory-mapped input and output
+        src = np.memmap(str(tmpdir.join('in.dat')), dtype=np.float64, mode='w+', shape=inarr.shape)
+        src[:] = inarr
+        dst = np.memmap(str(tmpdir.join('out.dat')), dtype=np.float32, mode='w+', shape=inarr.shape)
+        assert lb2g.convert_chunked(src, chunk_size=5, out=dst) is dst
+        np.testing.assert_array_almost_equal(dst, expected, decimal=1)
+
+        with pytest.raises(ValueError):
+            lb2g.convert_chunked(inarr, out=np.empty(3))
+
+    def test_convert_parallel(self):
+        m2ft = Converter('m', 'ft')
+        inarr = np.linspace(0, 100, PARALLEL_THRESHOLD + 7)
+
+        outarr = m2ft.evaluate(inarr, workers=4)
+        np.testing.assert_array_almost_equal(outarr, m2ft(inarr))
+
+        # Non-contiguous input and a preallocated output
+        strided = np.linspace(0, 100, 2 * PARALLEL_THRESHOLD + 14)[::2]
+        assert not strided.flags.c_contiguous
+        out = np.empty(strided.shape, dtype=np.float32)
+        assert m2ft.evaluate(strided, out=out, workers=3) is out
+        np.testing.assert_array_almost_equal(out, m2ft(strided), decimal=3)
+
+        # Small arrays stay on the calling thread
+        np.testing.assert_array_almost_equal(m2ft.evaluate([1, 2], workers=8), [3.28084, 6.56168], decimal=5)
+
+    def test_convert_parallel_fork(self):
+        # Forked children get thread pools of their own
+        m2ft = Converter('m', 'ft')
+        inarr = np.linspace(0, 100, PARALLEL_THRESHOLD + 7)
+        m2ft.evaluate(inarr, workers=2)
+
+        process = multiprocessing.Process(target=_convert_parallel_in_child, args=(m2ft, inarr))
+        process.start()
+        process.join(60)
+        if process.is_alive():
+            process.terminate()
+        assert process.exitcode == 0
+
     def test_combine_converters(self):
         s = Unit('s')
         min = Unit('min')
@@ -217,6 +394,82 @@ class TestUdunits2Converter:
         with pytest.raises(TypeError):
             s2min.combine('10')
 
+    def test_converter_cache(self):
+        CONVERTER_CACHE.clear()
+
+        c2k = Unit('degC').get_converter('K')
+        assert CONVERTER_CACHE.stats()['misses'] == 1
+
+        # Same units, spelled differently, share the converter
+        assert Unit('deg_c').get_converter(Unit('kelvin')) is c2k
+        assert CONVERTER_CACHE.stats()['hits'] == 1
+
+        # Non-convertible pairs are not cached
+        assert Unit('m').get_converter('s') is None
+        assert len(CONVERTER_CACHE) == 1
+
+        capacity = CONVERTER_CACHE.capacity
+        try:
+            CONVERTER_CACHE.capacity = 1
+            Unit('m').get_converter('ft')
+            assert len(CONVERTER_CACHE) == 1
+            assert CONVERTER_CACHE.stats()['evictions'] == 1
+        finally:
+            CONVERTER_CACHE.capacity = capacity
+            CONVERTER_CACHE.clear()
+
+        # Converters are not shared between Systems
+        s = System(path=DEFAULT_UDUNITS_PATH)
+        c2k = Unit('degC').get_converter('K')
+        c2k_s = Unit('degC', system=s).get_converter('K')
+        assert c2k_s is not c2k
+        assert Unit('deg_c', system=s).get_converter('kelvin') is c2k_s
+        assert Unit('deg_c').get_converter('kelvin') is c2k
+        CONVERTER_CACHE.clear()
+
+    def test_timestamp_converter(self):
+        conv = Unit('seconds since 1970-01-01').get_converter('days since 2000-01-01')
+        assert conv.coefficients is not None
+        np.testing.assert_array_almost_equal(conv([946684800.0, 946771200.0]), [0.0, 1.0])
+
+        values = np.arange(0, 1e6, 1234.5)
+        for calendar in ['noleap', '360_day', 'all_leap', 'julian', 'proleptic_gregorian']:
+            unit = Unit('hours since 1900-01-01', calendar=calendar)
+            conv = unit.get_converter(Unit('days since 2000-03-01 12:00', calendar=calendar))
+            assert conv.coefficients is not None
+            expected = utime('days since 2000-03-01 12:00', calendar).date2num(
+                utime('hours since 1900-01-01', calendar).num2date(values))
+            np.testing.assert_array_almost_equal(conv(values), expected)
+
+            clone = pickle.loads(pickle.dumps(conv))
+            assert clone.coefficients == conv.coefficients
+
+        # Origins that are not Julian/Gregorian dates are counted as written
+        feb30 = Unit('days since 2000-02-30', calendar='360_day')
+        mar1 = Unit('days since 2000-03-01 06:00', calendar='360_day')
+        assert feb30 != mar1
+        np.testing.assert_array_almost_equal(feb30.get_converter(mar1)([1.0, 2.0]), [-0.25, 0.75])
+        assert pickle.loads(pickle.dumps(feb30)).get_converter(mar1)(1.0) == pytest.approx(-0.25)
+        assert Unit('days', calendar='360_day').offset_by_time(utime('days since 2000-01-01', '360_day').num2date(59)) \
+            .get_converter(mar1)(1.0) == pytest.approx(-0.25)
+
+        # Origins netcdftime can't parse whole are taken from udunits
+        for spec, same in [('seconds since 1970', 'seconds since 1970-01-01'),
+                           ('days since 20000101', 'days since 2000-01-01'),
+                           ('hours since 2000-01-01 12:00:00.5', 'seconds since 2000-01-01 12:00'),
+                           ('hours since 2000-01-01 00:00 -06', 'hours since 2000-01-01 06:00')]:
+            unit = Unit(spec, calendar='noleap')
+            assert unit._origin is None
+            conv = unit.get_converter(Unit(same, calendar='noleap'))
+            assert conv(0.0) == pytest.approx(Unit(spec).get_converter(same)(0.0))
+        assert Unit('seconds since 1970', calendar='noleap').get_converter(
+            Unit('days since 1970-01-02', calendar='noleap'))(86400.0) == pytest.approx(0.0)
+
+        noleap = Unit('days since 2000-01-01', calendar='noleap')
+        assert noleap.get_converter(Unit('days since 2000-01-01', calendar='360_day')) is None
+        with pytest.raises(ValueError):
+            Converter(noleap, Unit('days since 2000-01-01', calendar='360_day'))
+
     def test_errors(self):
         s = Unit('s')
         min = Unit('min')
@@ -234,6 +487,125 @@ class TestUdunits2Converter:
             fake.this = None
             Converter(s, fake)
 
+def _convert_parallel_in_child(conv, inarr):
+    np.testing.assert_array_almost_equal(conv.evaluate(inarr, workers=2), conv(inarr))
+
+def _load_in_child():
+    s = System(path=DEFAULT_UDUNITS_PATH)
+    assert Converter(Unit('m', system=s), Unit('ft', system=s))(1.0) == pytest.approx(1 / 0.3048)
+
+def _convert_in_worker(args):
+    converter, values = args
+    return converter(values)
+
+class TestPickle:
+
+    def test_pickle_unit(self):
+        for spec in ('m', 'ft', 'km2/s', 'degC', 'hours since 1970-01-01'):
+            unit = Unit(spec)
+            clone = pickle.loads(pickle.dumps(unit, pickle.HIGHEST_PROTOCOL))
+            assert clone == unit
+            assert clone.system is get_default_system()
+
+        unit = Unit('days since 2000-01-01', calendar='360_day')
+        assert pickle.loads(pickle.dumps(unit)).calendar == '360_day'
+
+        log_unit = Unit('mW').log(10)
+        assert pickle.loads(pickle.dumps(log_unit)) == log_unit
+
+        # Units of a system without an XML database can't be rebuilt
+        with pytest.raises(TypeError):
+            pickle.dumps(System(empty=True).get_dimensionless_unit_one())
+
+    def test_pickle_converter(self):
+        for conv in (Converter('m', 'ft'), Converter('degC', 'degF'), Converter(scale=2.5, offset=1),
+                     Converter('s', 'min').combine(Converter('min', 'hr'))):
+            clone = pickle.loads(pickle.dumps(conv, pickle.HIGHEST_PROTOCOL))
+            assert clone.coefficients == conv.coefficients
+            np.testing.assert_array_almost_equal(clone([1.5, 20]), conv([1.5, 20]))
+            assert clone._spec is None
+
+        # Affine converters don't need their units' XML database
+        s = System(empty=True)
+        unit = s.new_dimensionless_unit()
+        with pytest.raises(TypeError):
+            pickle.dumps(unit)
+        conv = Converter(unit, unit * 4.0)
+        clone = pickle.loads(pickle.dumps(conv))
+        assert clone.coefficients == conv.coefficients == (0.25, 0.0)
+
+        for conv in (Converter(base=10), Converter(power=10), Converter(inverse=True)):
+            clone = pickle.loads(pickle.dumps(conv))
+            assert clone.coefficients is None
+            assert clone.get_expression() == conv.get_expression()
+            np.testing.assert_array_almost_equal(clone([1.5, 20]), conv([1.5, 20]))
+
+    def test_worker_pool(self):
+        CONVERTER_CACHE.clear()
+        system = warm_caches(units=['m', 'ft'], conversions=[('m', 'ft')])
+        assert ('ft', UT_ASCII) in system.unit_cache
+        assert len(CONVERTER_CACHE) == 1
+
+        pool = multiprocessing.Pool(2, initializer=warm_caches, initargs=(['m'], [('m', 'ft')]))
+        try:
+            results = pool.map(_convert_in_worker, [(Converter('m', 'ft'), [1.0, 2.0])] * 4)
+        finally:
+            pool.close()
+            pool.join()
+
+        for result in results:
+            np.testing.assert_array_almost_equal(result, [3.28084, 6.56168], decimal=5)
+
+class TestConvertFile:
+
+    def test_convert_npy(self, tmpdir):
+        src = str(tmpdir.join('in.npy'))
+        dst = str(tmpdir.join('out.npy'))
+        inarr = np.arange(1000, dtype=np.float32).reshape(10, 100)
+        np.save(src, inarr)
+
+        assert convert_file(src, dst, 'm', 'cm', block_size=1) == 1000
+        outarr = np.load(dst)
+        assert outarr.dtype == np.float32
+        assert outarr.shape == (10, 100)
+        np.testing.assert_array_almost_equal(outarr, inarr * 100)
+
+    def test_convert_raw(self, tmpdir):
+        src = tmpdir.join('in.dat')
+        dst = str(tmpdir.join('out.dat'))
+        header = b'HDR!'
+        src.write(header + np.array([0, 100, -40], dtype=np.int16).tobytes(), 'wb')
+
+        convert_file(str(src), dst, 'degC', 'K', dtype='int16', offset=len(header))
+        np.testing.assert_array_almost_equal(np.fromfile(dst, dtype=np.float64), [273.15, 373.15, 233.15])
+
+        assert convert_main([str(src), dst, 'degC', 'degF', '--dtype', 'int16', '--offset', '4',
+                             '--out-dtype', 'float32']) == 0
+        np.testing.assert_array_almost_equal(np.fromfile(dst, dtype=np.float32), [32.0, 212.0, -40.0], decimal=4)
+
+        with pytest.raises(ValueError):
+            convert_file(str(src), dst, 'm', 's', dtype='int16')
+
+    def test_convert_in_place(self, tmpdir):
+        src = str(tmpdir.join('in.npy'))
+        inarr = np.arange(1000.).reshape(10, 100)
+        np.save(src, inarr)
+        assert convert_file(src, str(tmpdir.join('.', 'in.npy')), 'm', 'cm', block_size=1) == 1000
+        np.testing.assert_array_almost_equal(np.load(src), inarr * 100)
+
+        raw = tmpdir.join('in.dat')
+        header = b'HDR!'
+        raw.write(header + np.array([0., 100., -40.]).tobytes(), 'wb')
+        convert_file(str(raw), str(raw), 'degC', 'K', offset=len(header))
+        data = raw.read('rb')
+        assert data[:4] == header
+        np.testing.assert_array_almost_equal(np.frombuffer(data[4:], dtype=np.float64), [273.15, 373.15, 233.15])
+
+        # The file is left as it was when it can't be converted in place
+        with pytest.raises(ValueError):
+            convert_file(src, src, 'm', 'cm', out_dtype='float32')
+        np.testing.assert_array_almost_equal(np.load(src), inarr * 100)
+
 class TestUdunits2System:
 
     def test_system(self):
@@ -242,3 +614,235 @@ class TestUdunits2System:
         assert s.get_unit_by_symbol('ft') == Unit('ft')
         assert s.get_dimensionless_unit_one() == Unit('1')
 
+    def test_default_system(self):
+        s = get_default_system()
+        assert isinstance(s, System)
+        assert get_default_system() is s
+        assert s.path == DEFAULT_UDUNITS_PATH
+
+        # DEFAULT_SYSTEM forwards to the lazily created system
+        assert DEFAULT_SYSTEM.this is s.this
+        assert Unit('m').system is s
+        assert Unit('m', system=DEFAULT_SYSTEM).system is s
+
+    def test_unit_cache(self):
+        s = System(path=DEFAULT_UDUNITS_PATH, cache_size=2)
+        stats = s.unit_cache.stats()
+        assert stats['hits'] == stats['misses'] == stats['evictions'] == 0
+
+        m = Unit('m', system=s)
+        m_ = Unit('m', system=s)
+        assert m.this is m_.this
+        assert s.unit_cache.stats()['hits'] == 1
+
+        # Clones are private copies of the cached handle
+        clone = s.parse('m', clone=True)
+        assert clone is not m.this
+        assert ut_compare(clone, m.this) == 0
+
+        Unit('ft', system=s)
+        Unit('s', system=s)
+        stats = s.unit_cache.stats()
+        assert stats['size'] == 2
+        assert stats['evictions'] == 1
+
+        s.unit_cache.clear()
+        assert len(s.unit_cache) == 0
+        assert s.unit_cache.stats()['hits'] == 0
+
+        with pytest.raises(UdunitsError):
+            s.parse('no-exist-unit')
+
+    def test_error_status_threads(self):
+        # Each error reports the status of its own call, whatever the other
+        # threads are doing
+        s = System(path=DEFAULT_UDUNITS_PATH)
+        errors = []
+
+        def parse(spec, expected):
+            for _ in range(200):
+                try:
+                    s.parse(spec)
+                except UdunitsError as ex:
+                    if expected is None or expected not in str(ex):
+                        errors.append(str(ex))
+                else:
+                    if expected is not None:
+                        errors.append(spec)
+
+        threads = [threading.Thread(target=parse, args=args)
+                   for args in [('m )', 'UT_SYNTAX'), ('nounit', 'UT_UNKNOWN'), ('m', None)] * 2]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert errors == []
+
+    def test_threads(self):
+        # Loading, parsing and converting concurrently
+        results = []
+
+        def work():
+            s = System(path=DEFAULT_UDUNITS_PATH)
+            ft = Unit('ft', system=s)
+            results.append(Converter(Unit('m', system=s), ft)(np.ones(1000))[0])
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        np.testing.assert_allclose(results, [1 / 0.3048] * 4)
+
+    def test_threads_free_systems(self):
+        # Systems freed by one thread while others parse and convert
+        s = System(path=DEFAULT_UDUNITS_PATH)
+        errors = []
+
+        def churn():
+            for _ in range(5):
+                Unit('km', system=System(path=DEFAULT_UDUNITS_PATH))
+
+        def parse():
+            for i in range(200):
+                try:
+                    conv = Converter(Unit('m', system=s), Unit('{0} ft'.format(i + 1), system=s))
+                    if abs(conv(1.0) - 1 / 0.3048 / (i + 1)) > 1e-9:
+                        errors.append(i)
+                except UdunitsError as ex:
+                    errors.append(str(ex))
+
+        threads = [threading.Thread(target=f) for f in [churn, churn, parse, parse]]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert errors == []
+
+    def test_fork_while_loading(self):
+        # Children forked while another thread holds the udunits lock (with
+        # the GIL released, loading a System) can still use udunits
+        done = threading.Event()
+
+        def load():
+            while not done.is_set():
+                System(path=DEFAULT_UDUNITS_PATH)
+
+        thread = threading.Thread(target=load)
+        thread.start()
+        try:
+            for _ in range(5):
+                process = multiprocessing.Process(target=_load_in_child)
+                process.start()
+                process.join(60)
+                if process.is_alive():
+                    process.terminate()
+                assert process.exitcode == 0
+        finally:
+            done.set()
+            thread.join()
+
+    def test_convertibility_matrix(self):
+        s = DEFAULT_SYSTEM
+        a = ['m', 'ft', Unit('s'), 'K', 'm']
+        b = ['km', 'hr', 'degC', 'kg']
+
+        matrix = s.convertibility_matrix(a, b)
+        assert matrix.dtype == bool
+        assert matrix.shape == (5, 4)
+        np.testing.assert_array_equal(matrix, [[True, False, False, False],
+                                               [True, False, False, False],
+                                               [False, True, False, False],
+                                               [False, False, True, False],
+                                               [True, False, False, False]])
+
+        assert s.convertibility_matrix([], b).shape == (0, 4)
+
+        with pytest.raises(TypeError):
+            s.convertibility_matrix([None], b)
+
+    def test_dimension(self):
+        s = DEFAULT_SYSTEM
+        assert s.dimension('m') == (('m', 1),)
+        assert s.dimension('knot') == s.dimension(Unit('km/h')) == (('m', 1), ('s', -1))
+        assert s.dimension('N') == (('kg', 1), ('m', 1), ('s', -2))
+        assert s.dimension('1') == ()
+        # Radians are dimensionless in udunits
+        assert s.dimension('sr') == ()
+        # Logarithmic units have no signature
+        assert s.dimension(Unit('mW').log(10)) is None
+
+        assert s.are_convertible('degC', 'degF')
+        assert not s.are_convertible('m', 's')
+        assert s.are_convertible(Unit('mW').log(10), Unit('mW').log(10))
+
+        # Reciprocal units are convertible, as with ut_are_convertible()
+        assert s.are_convertible('s', 'Hz')
+        assert s.are_convertible('m/s', 's/km') == Unit('m/s').are_convertible(Unit('s/km'))
+        np.testing.assert_array_equal(s.convertibility_matrix(['s', 'Hz', 'm'], ['min', 'kHz']),
+                                      [[True, True], [True, True], [False, False]])
+        assert 'Hz' in s.convertible_units('s') and 's' in s.convertible_units('Hz')
+
+    def test_dimension_index(self):
+        index = DEFAULT_SYSTEM.dimension_index
+        assert index.base_units == ('m', 'kg', 's', 'A', 'K', 'mol', 'cd')
+
+        assert 'meter' in index and 'ft' in index and 'degC' in index
+        assert index.vector('N') == (1, 1, -2, 0, 0, 0, 0)
+
+        ft = index['ft']
+        assert ft.dimension == (('m', 1),)
+        np.testing.assert_almost_equal(ft.scale, 0.3048)
+        assert ft.offset == 0.0
+
+        deg_c = index['degC']
+        np.testing.assert_almost_equal(deg_c.scale, 1.0)
+        np.testing.assert_almost_equal(deg_c.offset, 273.15)
+
+        velocities = DEFAULT_SYSTEM.convertible_units('m/s')
+        assert 'knot' in velocities and 'm' not in velocities
+        assert 'ft' in index.groups()[(('m', 1),)]
+
+    def test_snapshot(self, tmpdir):
+        xml_dir = tmpdir.mkdir('udunits')
+        for f in os.listdir(os.path.dirname(DEFAULT_UDUNITS_PATH)):
+            if f.endswith('.xml'):
+                xml_dir.join(f).write(open(os.path.join(os.path.dirname(DEFAULT_UDUNITS_PATH), f)).read())
+        path = str(xml_dir.join('udunits2.xml'))
+
+        assert load_snapshot(path) is None
+        dst = compile_snapshot(path)
+        assert dst == snapshot_path(path)
+
+        data = load_snapshot(path)
+        assert data['base_units'] == ('m', 'kg', 's', 'A', 'K', 'mol', 'cd')
+        assert data['entries']['ft'][0] == (('m', 1),)
+
+        # The index of a System on that database comes from the snapshot
+        index = System(path=path).dimension_index
+        assert index['ft'].dimension == (('m', 1),)
+        np.testing.assert_almost_equal(index['ft'].scale, 0.3048)
+
+        # Snapshots written elsewhere are passed to System
+        other = str(tmpdir.join('other.snapshot'))
+        assert snapshot_main(['-o', other, path]) == 0
+        os.remove(dst)
+        assert load_snapshot(path) is None
+        data = load_snapshot(path, other)
+        data['entries'] = {'ft': data['entries']['ft']}
+        with open(other, 'wb') as f:
+            pickle.dump(data, f)
+        assert list(System(path=path, snapshot=other).dimension_index.entries) == ['ft']
+        compile_snapshot(path)
+
+        # Touching any of the XML sources invalidates it
+        common = xml_dir.join('udunits2-common.xml')
+        common.setmtime(common.mtime() + 10)
+        assert load_snapshot(path) is None
+
+        # So does an edit that leaves the mtime as it was
+        compile_snapshot(path)
+        mtime = os.path.getmtime(str(common))
+        common.write(common.read() + '\n')
+        os.utime(str(common), (mtime, mtime))
+        assert load_snapshot(path) is None
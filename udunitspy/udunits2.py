@@ -22,12 +22,18 @@ Author: Christopher Mueller
 Copyright (C) UC Regents 2012
 """
 
-from copy import deepcopy
 import udunitspy.udunits2_c as ut
-from udunitspy.udunits2_c import UT_ASCII
+from udunitspy.udunits2_c import UT_ASCII, UT_UTF8, UT_DEFINITION
+from udunitspy.cache import LRUCache
+from udunitspy.netcdftime import ISO8601_REGEX, _calendars, _JulianDayFromFields, _parse_date
+from collections import namedtuple
+from xml.etree import ElementTree
 import os
-import numexpr as ne
+import re
+import numpy as np
 import sys
+import threading
+import atexit
 import logging
 try:
     # Python 2.7
@@ -68,72 +74,397 @@ class UdunitsError(Exception):
     def __init__(self, from_name, error_num, message=None):
         Exception.__init__(self, _make_error_message(from_name, error_num, message))
 
+# Default number of parsed units kept per System
+UNIT_CACHE_SIZE = 1024
+
 class System:
     """Unit system (ut_system).
     """
     
-    def __init__(self, path=None, empty=False):
+    def __init__(self, path=None, empty=False, cache_size=UNIT_CACHE_SIZE, snapshot=None):
         """Creates a unit system
+
+        'snapshot' is the snapshot of the database at 'path' when it was not
+        compiled to the default location (see udunitspy.snapshot).
         """
+        # Parsed ut_unit handles keyed by (spec, encoding)
+        self.unit_cache = LRUCache(cache_size)
+        self.path = None if empty else path
+        self.snapshot = snapshot
+        self._dimension_index = None
+        self._dimensionless_terms = {}
+
         if empty:
-            self.this = ut.new_system()
-        elif path:
-            self.this = ut.read_xml(path)
+            self.this, status = ut.new_system_status()
         else:
-            self.this = ut.read_xml(None)
+            self.this, status = ut.read_xml_status(path or None)
 
         if not self.this:
-            raise UdunitsError(System.__init__.__name__, ut.get_status())
+            raise UdunitsError(System.__init__.__name__, status)
+
+    def parse(self, spec, encoding=None, clone=False):
+        """Parse 'spec' into a ut_unit handle. Calls ut_parse() on a cache miss.
+
+        Handles are shared between callers; pass clone=True to get a private
+        copy that is safe to modify.
+        """
+        encoding = encoding or UT_ASCII
+        key = (spec, encoding)
+        handle = self.unit_cache.get(key)
+        if handle is None:
+            handle, status = ut.parse_status(self.this, spec, encoding)
+            if not handle:
+                raise UdunitsError(System.parse.__name__, status, 'Cannot parse \'{0}\''.format(spec))
+
+            self.unit_cache.put(key, handle)
+
+        if clone:
+            return ut.clone(handle)
+
+        return handle
+
+    @property
+    def dimension_index(self):
+        """DimensionIndex of every unit name and symbol in this system's XML
+        database, built on first access.  Loaded from a snapshot of the
+        database (see udunitspy.snapshot) when one is up to date.
+        """
+        if self._dimension_index is None:
+            from udunitspy.snapshot import load_snapshot
+            snapshot = load_snapshot(self.path, self.snapshot) if self.path else None
+            if snapshot is not None:
+                self._dimension_index = DimensionIndex(self, base_units=snapshot['base_units'],
+                                                       entries=snapshot['entries'])
+            else:
+                self._dimension_index = DimensionIndex(self)
+
+        return self._dimension_index
+
+    def dimension(self, unit):
+        """Dimensional signature of 'unit' (a str spec, Unit or ut_unit handle).
+
+        The signature is a tuple of (base unit symbol, exponent) pairs, e.g.
+        (('m', 1), ('s', -1)) for 'knot', and () for dimensionless units.
+        Units with equal signatures are convertible.  Returns None for units
+        that have no such signature (logarithmic and timestamp units).
+        """
+        if isinstance(unit, (str, unicode)):
+            if self._dimension_index is not None and unit in self._dimension_index:
+                return self._dimension_index[unit].dimension
+            unit = self.parse(unit)
+        elif isinstance(unit, Unit):
+            unit = unit.this
+
+        definition = _parse_definition(_format_definition(unit))
+        if definition is None:
+            return None
+
+        _, terms, _ = definition
+        dimension = []
+        for symbol, exponent in terms:
+            if symbol not in self._dimensionless_terms:
+                self._dimensionless_terms[symbol] = bool(ut.is_dimensionless(self.parse(symbol)))
+            if not self._dimensionless_terms[symbol]:
+                dimension.append((symbol, exponent))
+
+        return tuple(sorted(dimension))
+
+    def are_convertible(self, unit_1, unit_2):
+        """Whether 'unit_1' can be converted to 'unit_2', comparing dimensional
+        signatures where possible and falling back to ut_are_convertible().
+        """
+        dim_1 = self.dimension(unit_1)
+        dim_2 = self.dimension(unit_2)
+        if dim_1 is not None and dim_2 is not None:
+            return _convertibility_key(dim_1) == _convertibility_key(dim_2)
+
+        handles = [self.parse(u) if isinstance(u, (str, unicode)) else getattr(u, 'this', u) for u in (unit_1, unit_2)]
+        return bool(ut.are_convertible(*handles))
+
+    def convertible_units(self, unit):
+        """Names and symbols in the dimension index convertible with 'unit'.
+        """
+        dimension = self.dimension(unit)
+        if dimension is None:
+            return []
+
+        index = self.dimension_index
+        units = index.units_with_dimension(dimension)
+        inverse = _invert_dimension(dimension)
+        if inverse != dimension:
+            units = sorted(units + index.units_with_dimension(inverse))
+
+        return units
+
+    def convertibility_matrix(self, units_a, units_b):
+        """Boolean numpy matrix whose [i, j] entry says whether units_a[i]
+        is convertible to units_b[j].
+
+        Units (str specs or Unit instances) are first sorted into groups of
+        mutually convertible units, keyed by their dimensional signature up
+        to inversion (udunits converts between reciprocal units), so
+        the matrix itself costs one integer comparison per pair.  Units
+        without a signature are compared against a single representative
+        per group instead.
+        """
+        representatives = []
+        dimensions = {}
+        groups = {}
+
+        def group_of(unit):
+            if isinstance(unit, (str, unicode)):
+                if unit in groups:
+                    return groups[unit]
+                handle = self.parse(unit)
+            elif isinstance(unit, Unit):
+                handle = unit.this
+            else:
+                raise TypeError('\'unit\' must be a str or Unit. Got: {0}'.format(unit))
+
+            dimension = self.dimension(unit)
+            if dimension is not None:
+                key = _convertibility_key(dimension)
+                group = dimensions.get(key)
+                if group is None:
+                    group = dimensions[key] = len(representatives)
+                    representatives.append(handle)
+            else:
+                for group, rep in enumerate(representatives):
+                    if ut.are_convertible(handle, rep):
+                        break
+                else:
+                    group = len(representatives)
+                    representatives.append(handle)
+
+            if isinstance(unit, (str, unicode)):
+                groups[unit] = group
+
+            return group
+
+        a = np.array([group_of(u) for u in units_a], dtype=int)
+        b = np.array([group_of(u) for u in units_b], dtype=int)
+
+        return a[:, np.newaxis] == b[np.newaxis, :]
 
     def get_unit_by_name(self, name):
-        ret = Unit(system=self.this)
-        ret.this = ut.get_unit_by_name(self.this, name)
+        ret = Unit(system=self)
+        ret.this, status = ut.get_unit_by_name_status(self.this, name)
         if not ret.this:
-            raise UdunitsError(System.get_unit_by_name.__name__, ut.get_status(), 'No unit with name \'{0}\' in system'.format(name))
+            raise UdunitsError(System.get_unit_by_name.__name__, status, 'No unit with name \'{0}\' in system'.format(name))
 
         return ret
 
     def get_unit_by_symbol(self, symbol):
-        ret = Unit(system=self.this)
-        ret.this = ut.get_unit_by_symbol(self.this, symbol)
+        ret = Unit(system=self)
+        ret.this, status = ut.get_unit_by_symbol_status(self.this, symbol)
         if not ret.this:
-            raise UdunitsError(System.get_unit_by_symbol.__name__, ut.get_status(), 'No unit with symbol \'{0}\' in system'.format(symbol))
+            raise UdunitsError(System.get_unit_by_symbol.__name__, status, 'No unit with symbol \'{0}\' in system'.format(symbol))
 
         return ret
 
     def add_name_prefix(self, name, value):
         res = ut.add_name_prefix(self.this, name, value)
         if res: # anything other than 0
-            raise UdunitsError(System.add_name_prefix.__name__, ut.get_status())
+            raise UdunitsError(System.add_name_prefix.__name__, res)
 
     def add_symbol_prefix(self, symbol, value):
         res = ut.add_symbol_prefix(self.this, symbol, value)
         if res: # anything other than 0
-            raise UdunitsError(System.add_symbol_prefix.__name__, ut.get_status())
+            raise UdunitsError(System.add_symbol_prefix.__name__, res)
 
     def new_base_unit(self):
-        res = ut.new_base_unit(self.this)
+        res, status = ut.new_base_unit_status(self.this)
         if not res:
-            raise UdunitsError(System.new_base_unit.__name__, ut.get_status())
+            raise UdunitsError(System.new_base_unit.__name__, status)
 
         return res
 
     def new_dimensionless_unit(self):
-        ret = Unit(system=self.this)
-        ret.this = ut.new_dimensionless_unit(self.this)
+        ret = Unit(system=self)
+        ret.this, status = ut.new_dimensionless_unit_status(self.this)
         if not ret.this:
-            raise UdunitsError(System.new_dimensionless_unit.__name__, ut.get_status())
+            raise UdunitsError(System.new_dimensionless_unit.__name__, status)
 
         return ret
 
     def get_dimensionless_unit_one(self):
-        ret = Unit(system=self.this)
-        ret.this = ut.get_dimensionless_unit_one(self.this)
+        ret = Unit(system=self)
+        ret.this, status = ut.get_dimensionless_unit_one_status(self.this)
         if not ret.this:
-            raise UdunitsError(System.get_dimensionless_unit_one.__name__, ut.get_status())
+            raise UdunitsError(System.get_dimensionless_unit_one.__name__, status)
 
         return ret
 
+DimensionEntry = namedtuple('DimensionEntry', ['dimension', 'scale', 'offset'])
+
+class DimensionIndex:
+    """Index of the named and symbolic units of a System's XML database.
+
+    Maps each name/symbol to a DimensionEntry of its dimensional signature
+    (see System.dimension) plus the scale and offset relative to the
+    product of base units with that signature: base = scale*value + offset.
+    Entries whose scale/offset cannot be expressed that way have None for
+    both.
+    """
+
+    def __init__(self, system, names=None, base_units=None, entries=None):
+        self.system = system
+        self.entries = {}
+        self._by_dimension = {}
+
+        if entries is not None:
+            # Precomputed, e.g. loaded from a snapshot (see udunitspy.snapshot)
+            names = []
+            for name, entry in entries.items():
+                self.entries[name] = DimensionEntry(*entry)
+        elif names is None:
+            names, base_units = _read_unit_names(system.path) if system.path else ([], [])
+
+        for name in names:
+            entry = self._make_entry(name)
+            if entry is not None:
+                self.entries[name] = entry
+        for name, entry in self.entries.items():
+            self._by_dimension.setdefault(entry.dimension, []).append(name)
+
+        if not base_units:
+            base_units = sorted(set(symbol for dim in self._by_dimension for symbol, _ in dim))
+        self.base_units = tuple(base_units)
+
+    def _make_entry(self, name):
+        try:
+            handle = _parse_name(self.system, name)
+            dimension = self.system.dimension(handle)
+        except UdunitsError:
+            return None
+        if dimension is None:
+            return None
+
+        base = '.'.join('{0}{1}'.format(symbol, exponent) for symbol, exponent in dimension) or '1'
+        try:
+            coefficients = Converter(handle, self.system.parse(base)).coefficients
+        except UdunitsError:
+            coefficients = None
+        scale, offset = coefficients or (None, None)
+
+        return DimensionEntry(dimension, scale, offset)
+
+    def __getitem__(self, name):
+        return self.entries[name]
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def names(self):
+        return sorted(self.entries)
+
+    def vector(self, dimension):
+        """Exponents of 'dimension' (a signature or an indexed name) over base_units."""
+        if isinstance(dimension, (str, unicode)):
+            dimension = self.entries[dimension].dimension
+        exponents = dict(dimension)
+
+        return tuple(exponents.get(symbol, 0) for symbol in self.base_units)
+
+    def units_with_dimension(self, dimension):
+        return sorted(self._by_dimension.get(dimension, []))
+
+    def groups(self):
+        """Mapping of dimensional signature to the names sharing it."""
+        return dict((dim, sorted(names)) for dim, names in self._by_dimension.items())
+
+def _invert_dimension(dimension):
+    return tuple((symbol, -exponent) for symbol, exponent in dimension)
+
+def _convertibility_key(dimension):
+    # ut_are_convertible() also accepts reciprocal units ('s' and 'Hz'), so
+    # signatures are compared up to their overall sign: the key is the one of
+    # the pair whose first exponent is positive
+    if dimension and dimension[0][1] < 0:
+        return _invert_dimension(dimension)
+
+    return dimension
+
+_DEFINITION_TERM = re.compile(r'^([^\W\d]+)(-?\d+)?$', re.UNICODE)
+
+def _format_definition(handle):
+    n, result = ut.format(handle, 2048, UT_ASCII | UT_DEFINITION)
+    if n < 0:
+        return None
+
+    return result
+
+def _parse_definition(definition):
+    # Splits a ut_format(UT_DEFINITION) string such as '0.3048 m',
+    # 'kg.m.s-2' or 'K @ 273.15' into (scale, [(symbol, exponent), ...],
+    # origin).  Returns None for anything else, e.g. logarithmic or
+    # timestamp units.
+    if definition is None:
+        return None
+
+    head, _, origin = definition.partition('@')
+    try:
+        origin = float(origin) if origin.strip() else 0.0
+    except ValueError:
+        return None
+
+    parts = head.split()
+    scale = 1.0
+    if parts:
+        try:
+            scale = float(parts[0])
+            parts = parts[1:]
+        except ValueError:
+            pass
+    if len(parts) > 1:
+        return None
+
+    terms = []
+    for term in (parts[0].split('.') if parts else []):
+        match = _DEFINITION_TERM.match(term)
+        if not match:
+            return None
+        terms.append((match.group(1), int(match.group(2) or 1)))
+
+    return scale, terms, origin
+
+def _parse_name(system, name):
+    if isinstance(name, unicode):
+        try:
+            name = name.encode('ascii')
+        except UnicodeError:
+            return system.parse(name.encode('utf-8'), UT_UTF8)
+
+    return system.parse(name)
+
+def _read_unit_names(path, sources=None):
+    # Collects the names, plurals and symbols (including aliases) of every
+    # unit in the XML database at 'path', following <import> elements, and
+    # the symbols of its dimensional base units.  The files read are
+    # appended to 'sources' if given.
+    names = []
+    base_units = []
+
+    def read(path):
+        if sources is not None:
+            sources.append(os.path.realpath(path))
+        root = ElementTree.parse(path).getroot()
+        for element in root:
+            if element.tag == 'import':
+                read(os.path.join(os.path.dirname(path), element.text.strip()))
+            elif element.tag == 'unit':
+                for tag in ('name/singular', 'name/plural', 'symbol',
+                            'aliases/name/singular', 'aliases/name/plural', 'aliases/symbol'):
+                    names.extend(e.text.strip() for e in element.findall(tag) if e.text)
+                if element.find('base') is not None:
+                    base_units.extend(e.text.strip() for e in element.findall('symbol'))
+
+    read(path)
+    return names, base_units
+
 # Check various locations for a default UDUNITS2 library
 # Pip installed location
 DEFAULT_UDUNITS_PATH = os.path.realpath(os.path.join(sys.prefix, 'etc','udunits','udunits2.xml'))
@@ -144,30 +475,120 @@ if not os.path.exists(DEFAULT_UDUNITS_PATH):
     # Installed by udunits library
     DEFAULT_UDUNITS_PATH = '/usr/share/xml/udunits/udunits2.xml'
 
-log.info('Using udunits2.xml database: %s', DEFAULT_UDUNITS_PATH)
-DEFAULT_SYSTEM = System(path=DEFAULT_UDUNITS_PATH)
+_default_system = None
+_default_system_lock = threading.Lock()
+
+def get_default_system():
+    """The System read from DEFAULT_UDUNITS_PATH, built on first use.
+
+    Importing the module does not read the XML database; the first caller
+    does, exactly once, even when several threads race for it.
+    """
+    global _default_system
+    if _default_system is None:
+        with _default_system_lock:
+            if _default_system is None:
+                log.info('Using udunits2.xml database: %s', DEFAULT_UDUNITS_PATH)
+                _default_system = System(path=DEFAULT_UDUNITS_PATH)
+
+    return _default_system
+
+_systems = {}
+
+def _get_system(path=None):
+    # The System for the XML database at 'path' (None for the default one),
+    # shared by everything unpickled against it
+    if path is None or os.path.realpath(path) == os.path.realpath(DEFAULT_UDUNITS_PATH):
+        return get_default_system()
+
+    path = os.path.realpath(path)
+    with _default_system_lock:
+        system = _systems.get(path)
+        if system is None:
+            system = _systems[path] = System(path=path)
+
+        return system
+
+class _DefaultSystem(object):
+    """Stand-in for the default System; builds it on first attribute access.
+    """
+
+    def __getattr__(self, name):
+        return getattr(get_default_system(), name)
+
+    def __repr__(self):
+        return '<default udunits system: {0}>'.format(DEFAULT_UDUNITS_PATH)
+
+DEFAULT_SYSTEM = _DefaultSystem()
+
+# Calendars whose dates udunits itself encodes (mixed Julian/Gregorian)
+UDUNITS_CALENDARS = (None, 'standard', 'gregorian')
+
+def _calendar(unit):
+    calendar = getattr(unit, 'calendar', None)
+    return None if calendar in UDUNITS_CALENDARS else calendar
 
 class Unit:
     """Unit class (ut_unit).
     """
 
-    def __init__(self, spec = "", system=None, encoding=None):
+    # (year, month, day, hour, minute, second, utc offset in minutes) of the
+    # origin of a timestamp unit of a non-udunits calendar, as written.  The
+    # parsed ut_unit has it normalized to a valid Julian/Gregorian date.
+    _origin = None
+
+    def __init__(self, spec = "", system=None, encoding=None, calendar=None):
         """Initialize a unit. Calls ut_parse().
+
+        'calendar' is the CF calendar of a timestamp unit ("hours since
+        1970-01-01"); the default (None, 'standard' or 'gregorian') is the
+        mixed Julian/Gregorian calendar udunits uses.
         """
+        if calendar not in UDUNITS_CALENDARS and calendar not in _calendars:
+            raise ValueError('Unknown calendar \'{0}\', must be one of {1}'.format(calendar, _calendars))
+        self.calendar = calendar
         if not system and isinstance(system, (str, unicode)):
             system = System(path=system)
-        self.system = system or DEFAULT_SYSTEM
-        self.this = ut.parse(self.system.this, spec, encoding or UT_ASCII)
+        if not system or system is DEFAULT_SYSTEM:
+            system = get_default_system()
+        self.system = system
+        if isinstance(self.system, System):
+            self.this = self.system.parse(spec, encoding)
+        else:
+            # A bare ut_system handle; nothing to cache against
+            self.this, status = ut.parse_status(self.system.this, spec, encoding or UT_ASCII)
 
-        if not self.this:
-            raise UdunitsError(Unit.__init__.__name__, ut.get_status())
+            if not self.this:
+                raise UdunitsError(Unit.__init__.__name__, status)
+
+        if _calendar(self) is not None and isinstance(spec, (str, unicode)):
+            self._origin = _origin_fields(spec)
 
     def copy(self):
-        result = Unit(system=self.system)
+        result = Unit(system=self.system, calendar=self.calendar)
         result.this = ut.clone(self.this)
+        result._origin = self._origin
 
         return result
 
+    def __getstate__(self):
+        # Units are pickled as their spec plus the path of their system's
+        # XML database, and re-parsed against that database on unpickling
+        if self.system is _default_system:
+            path = None
+        elif isinstance(self.system, System) and self.system.path:
+            path = self.system.path
+        else:
+            raise TypeError('Units of a System not read from an XML database cannot be pickled')
+
+        return {'spec': self.format(), 'path': path, 'calendar': self.calendar, 'origin': self._origin}
+
+    def __setstate__(self, state):
+        self.system = _get_system(state['path'])
+        self.this = self.system.parse(state['spec'])
+        self.calendar = state.get('calendar')
+        self._origin = state.get('origin')
+
     def __str__(self):
         return self.name
 
@@ -225,8 +646,39 @@ class Unit:
     def __add__(self, x):
         return self.__sub__(-x)
 
+    def offset_by_time(self, origin):
+        """Return the timestamp unit "<self> since <origin>". Calls ut_offset_by_time().
+
+        'origin' is a value from ut_encode_time() (a date of the mixed
+        Julian/Gregorian calendar) or a datetime-like object (with year,
+        month, day, hour, minute and second attributes) giving a date of
+        this unit's calendar.  The result has the same calendar as this
+        unit.
+        """
+        fields = None
+        if hasattr(origin, 'year'):
+            second = origin.second + getattr(origin, 'microsecond', 0) / 1e6
+            fields = (origin.year, origin.month, origin.day, origin.hour, origin.minute, second, 0)
+            origin = ut.encode_time(origin.year, origin.month, origin.day, origin.hour, origin.minute, second)
+
+        result = Unit(system=self.system, calendar=self.calendar)
+        result.this, status = ut.offset_by_time_status(self.this, float(origin))
+        if not result.this:
+            raise UdunitsError(Unit.offset_by_time.__name__, status)
+        if _calendar(self) is not None:
+            result._origin = fields
+
+        return result
+
+    def is_timestamp(self):
+        """Whether this is a timestamp unit ("<time unit> since <origin>")."""
+        return bool(ut.are_convertible(self.this, _time_origin(self.system).this))
+
     def __cmp__(self, other):
-        return ut.compare(self.this, other.this)
+        # Timestamp units of different calendars (or origins that udunits
+        # normalizes to the same date) count different days
+        return ut.compare(self.this, other.this) or \
+            cmp((_calendar(self), self._origin), (_calendar(other), getattr(other, '_origin', None)))
 
     def set_second(self,):
         ut.set_second(self.this)
@@ -272,7 +724,11 @@ class Unit:
         else:
             raise TypeError('\'unit\' must be a str or Unit. Got: {0}'.format(unit))
 
-        return bool(ut.are_convertible(self.this, unit.this))
+        if not ut.are_convertible(self.this, unit.this):
+            return False
+
+        # Timestamps of different calendars don't count the same days
+        return _calendar(self) == _calendar(unit) or not self.is_timestamp()
 
     def get_converter(self, unit):
         if isinstance(unit, (str, unicode)):
@@ -282,8 +738,18 @@ class Unit:
         else:
             raise TypeError('\'unit\' must be a str or Unit. Got: {0}'.format(unit))
 
+        key = _converter_key(self, unit)
+        if key is not None:
+            conv = CONVERTER_CACHE.get(key)
+            if conv is not None:
+                return conv
+
         if self.are_convertible(unit):
-            return Converter(self.this, unit.this)
+            conv = Converter(self, unit)
+            if key is not None:
+                CONVERTER_CACHE.put(key, conv)
+
+            return conv
 
     def invert(self):
         result = Unit(system=self.system)
@@ -300,6 +766,155 @@ class Unit:
         result.this = ut.log(float(base), self.this)
         return result
 
+# Converters returned by Unit.get_converter, keyed by the canonical
+# (base-unit definition) forms of the two units and their System: the same
+# spec may mean something else in a System read from another XML database.
+# Resize with CONVERTER_CACHE.capacity = n
+CONVERTER_CACHE_SIZE = 256
+CONVERTER_CACHE = LRUCache(CONVERTER_CACHE_SIZE)
+
+def _canonical(unit):
+    n, result = ut.format(unit.this, 2048, UT_ASCII | UT_DEFINITION)
+    if n < 0:
+        return None
+
+    return result
+
+def _converter_key(unit_1, unit_2):
+    from_ = _canonical(unit_1)
+    to = _canonical(unit_2)
+    if from_ is None or to is None:
+        return None
+
+    # The System itself rather than its id(), which a later System could reuse
+    return unit_1.system, from_, to, _calendar(unit_1), _calendar(unit_2), \
+        getattr(unit_1, '_origin', None), getattr(unit_2, '_origin', None)
+
+# Timestamp unit whose values are those of ut_encode_time()
+_TIME_ORIGIN_SPEC = 'seconds since 2001-01-01 00:00:00'
+
+def _time_origin(system):
+    if isinstance(system, System):
+        return Unit(_TIME_ORIGIN_SPEC, system=system)
+
+    return Unit('s', system=system).offset_by_time(0.0)
+
+# Separates the time unit from the origin of a timestamp unit spec
+_TIMESTAMP_ORIGIN = re.compile(r'\s(?:since|after|from|ref)\s+(.*)$|@\s*(.*)$', re.IGNORECASE)
+
+def _origin_fields(spec):
+    # The origin of timestamp unit 'spec' as written, parsed the way
+    # netcdftime parses it (see netcdftime._dateparse), or None when that
+    # parser can't read all of it: udunits also takes years alone, packed
+    # dates (20000101), fractional seconds and '-06' offsets, and its own
+    # decoding of those is used instead
+    match = _TIMESTAMP_ORIGIN.search(spec)
+    if match is None:
+        return None
+    origin = (match.group(1) or match.group(2)).strip()
+    parsed = ISO8601_REGEX.match(origin)
+    if parsed is None or parsed.end() != len(origin) or parsed.group('day') is None or parsed.group('fraction'):
+        return None
+    try:
+        return _parse_date(origin)
+    except (TypeError, ValueError):
+        return None
+
+def _timestamp_origin(unit):
+    # (seconds per unit, Julian Day of the origin in the unit's calendar).
+    # The origin is counted in the unit's calendar from the date as written:
+    # udunits normalizes dates that are not valid Julian/Gregorian ones
+    # (2000-02-30), so its own origin is only used when the unit's spec is
+    # not known.
+    cv, status = ut.get_converter_status(unit.this, _time_origin(unit.system).this)
+    if not cv:
+        raise UdunitsError(Converter.__init__.__name__, status, '\'{0}\' is not a timestamp unit'.format(unit))
+    offset = ut.cv_convert_double(cv, 0.0)
+    scale = (ut.cv_convert_double(cv, _PROBE) - offset) / _PROBE
+    if unit._origin is not None:
+        year, month, day, hour, minute, second, utc_offset = unit._origin
+        jd = _JulianDayFromFields(year, month, day, hour, minute, second, unit.calendar) - utc_offset / 1440.
+    else:
+        year, month, day, hour, minute, second, _ = ut.decode_time(offset)
+        jd = _JulianDayFromFields(year, month, day, hour, minute, second, unit.calendar)
+
+    return scale, float(jd)
+
+def _timestamp_coefficients(unit_1, unit_2):
+    # (scale, offset) converting between two timestamp units of the same
+    # netcdftime calendar: both count seconds from their origin's Julian Day
+    scale_1, jd_1 = _timestamp_origin(unit_1)
+    scale_2, jd_2 = _timestamp_origin(unit_2)
+
+    return scale_1 / scale_2, (jd_1 - jd_2) * 86400. / scale_2
+
+# Marks Converter coefficients that have not been worked out yet
+_UNKNOWN = object()
+# Function calls, powers or divisions (inverse converters) in a
+# cv_get_expression() string mean the converter is not affine
+_NONLINEAR_EXPRESSION = re.compile(r'[A-Za-z_]\w*\s*\(|\^|/')
+# Point at which unit-derived converters are sampled for their scale
+_PROBE = float(2**20)
+
+# Default number of elements per block for Converter.convert_chunked
+CHUNK_SIZE = 1 << 20
+
+# Arrays smaller than this are converted on the calling thread even when
+# workers are requested
+PARALLEL_THRESHOLD = 1 << 20
+
+_thread_pools = {}
+_thread_pools_lock = threading.Lock()
+# Process the pools were started in: their threads don't survive fork(), so
+# a child starts over with its own
+_thread_pools_pid = os.getpid()
+
+def _get_thread_pool(workers):
+    global _thread_pools, _thread_pools_lock, _thread_pools_pid
+    if _thread_pools_pid != os.getpid():
+        # The lock may have been held by another thread at fork() time
+        _thread_pools, _thread_pools_lock, _thread_pools_pid = {}, threading.Lock(), os.getpid()
+
+    with _thread_pools_lock:
+        pool = _thread_pools.get(workers)
+        if pool is None:
+            from multiprocessing.pool import ThreadPool
+            pool = _thread_pools[workers] = ThreadPool(workers)
+
+        return pool
+
+@atexit.register
+def _close_thread_pools():
+    if _thread_pools_pid == os.getpid():
+        for pool in _thread_pools.values():
+            pool.terminate()
+
+# Array types that can be handed to the C converter without a copy
+NATIVE_DTYPES = (np.dtype(np.float32), np.dtype(np.float64))
+
+def _result_dtype(value):
+    # Conversions keep the dtype of float32/float64 input on every path (the
+    # arithmetic itself is done in double); anything else comes out float64
+    dtype = getattr(value, 'dtype', None)
+    if dtype is not None and dtype in NATIVE_DTYPES:
+        return dtype.newbyteorder('=')
+
+    return np.dtype(np.double)
+
+def _is_native_array(x, dtype=None):
+    return isinstance(x, np.ndarray) and x.dtype in NATIVE_DTYPES and x.dtype.isnative \
+        and x.flags.c_contiguous and (dtype is None or x.dtype == dtype)
+
+def _squeeze(ret):
+    ret = ret.squeeze()
+    if ret.size == 1:
+        if ret.ndim == 0:
+            ret = ret[()]
+        else:
+            ret = ret[0]
+
+    return ret
+
 class Converter:
     """Unit converter class (cv_converter).
     """
@@ -308,20 +923,37 @@ class Converter:
                  scale=None, offset=None, base=None, power=None):
         """Initialize a converter.
         """
+        # (scale, offset) of an affine converter, None for anything else
+        self._coefficients = _UNKNOWN
+        # How to rebuild a non-affine converter when unpickling
+        self._spec = None
+        # The cv_get_*() constructors only fail when out of memory
+        status = ut.UT_OS
+
         if trivial:
             self.this = ut.cv_get_trivial()
+            self._coefficients = (1.0, 0.0)
         elif inverse:
             self.this = ut.cv_get_inverse()
+            self._coefficients = None
+            self._spec = ('inverse',)
         elif scale is not None and offset is not None:
             self.this = ut.cv_get_galilean(scale, offset)
+            self._coefficients = (float(scale), float(offset))
         elif scale is not None:
             self.this = ut.cv_get_scale(scale)
+            self._coefficients = (float(scale), 0.0)
         elif offset is not None:
             self.this = ut.cv_get_offset(offset)
+            self._coefficients = (1.0, float(offset))
         elif base is not None:
             self.this = ut.cv_get_log(base)
+            self._coefficients = None
+            self._spec = ('log', base)
         elif power is not None:
             self.this = ut.cv_get_pow(power)
+            self._coefficients = None
+            self._spec = ('pow', power)
         else:
             if unit_1 is None or unit_2 is None:
                 raise TypeError('\'unit_1\' and \'unit_2\' cannot be None')
@@ -330,18 +962,37 @@ class Converter:
                 unit_1 = Unit(unit_1)
             if isinstance(unit_2, str):
                 unit_2 = Unit(unit_2)
-            self.this = ut.get_converter(unit_1.this, unit_2.this)
+            calendars = _calendar(unit_1), _calendar(unit_2)
+            if calendars == (None, None) or not (unit_1.is_timestamp() and unit_2.is_timestamp()):
+                self.this, status = ut.get_converter_status(unit_1.this, unit_2.this)
+                if isinstance(unit_1, Unit) and isinstance(unit_2, Unit):
+                    self._spec = ('units', unit_1, unit_2)
+            elif calendars[0] != calendars[1]:
+                raise ValueError('Cannot convert between the \'{0}\' and \'{1}\' calendars'.format(
+                    unit_1.calendar, unit_2.calendar))
+            else:
+                # udunits only knows the mixed Julian/Gregorian calendar, but
+                # timestamps of any one calendar still convert affinely
+                self._coefficients = _timestamp_coefficients(unit_1, unit_2)
+                self.this = ut.cv_get_galilean(*self._coefficients)
 
         if self.this is None:
-            raise UdunitsError(Converter.__init__.__name__, ut.get_status())
+            raise UdunitsError(Converter.__init__.__name__, status)
 
-    def __call__(self, x):
+    def __call__(self, x, out=None, workers=None):
         if isinstance(x, Converter):
-            self.combine(x)
+            return self.combine(x)
         elif isinstance(x, (int, long, float)):
             return ut.cv_convert_double(self.this, float(x))
         elif hasattr(x, '__iter__'):
-            return self._evaluate(x)
+            if workers and workers > 1 and np.size(x) >= PARALLEL_THRESHOLD:
+                ret = self._convert_parallel(np.asarray(x), out, int(workers))
+            else:
+                ret = self._convert(x, out)
+            if out is not None:
+                return out
+
+            return _squeeze(ret)
 
     def combine(self, other):
         if not isinstance(other, Converter):
@@ -350,10 +1001,29 @@ class Converter:
         result = Converter(trivial=True)
         result.this = ut.cv_combine(other.this, self.this)
         if not result.this:
-            raise UdunitsError(Converter.__call__.__name__, ut.get_status(), 'ut_cv_combine failure')
+            raise UdunitsError(Converter.__call__.__name__, ut.UT_OS, 'ut_cv_combine failure')
+        result._coefficients = _UNKNOWN
+        result._spec = ('combine', self, other)
 
         return result
 
+    @property
+    def coefficients(self):
+        """(scale, offset) such that y = scale*x + offset, or None if the
+        converter is not affine (log, pow, inverse or combinations thereof).
+        """
+        if self._coefficients is _UNKNOWN:
+            if _NONLINEAR_EXPRESSION.search(self.get_expression('x')):
+                self._coefficients = None
+            else:
+                # Probe far from the origin so a large offset doesn't eat
+                # into the precision of the scale
+                offset = ut.cv_convert_double(self.this, 0.0)
+                scale = (ut.cv_convert_double(self.this, _PROBE) - offset) / _PROBE
+                self._coefficients = (scale, offset)
+
+        return self._coefficients
+
     def get_expression(self, variable=None):
         if variable is None:
             variable = 'x'
@@ -362,25 +1032,187 @@ class Converter:
         _, result = ut.cv_get_expression(self.this, 2048, variable)
         return result
 
-    def evaluate(self, value):
-        return self(value)
+    def evaluate(self, value, out=None, workers=None):
+        """Convert a scalar or a sequence of values.
+
+        If 'out' is given the converted values are written into it and it is
+        returned as-is, otherwise a new (squeezed) array or scalar is returned,
+        float32 for float32 input and float64 for anything else.
+
+        With workers=N, arrays of at least PARALLEL_THRESHOLD elements are
+        split into N slices converted concurrently on a thread pool; all
+        conversion paths release the GIL while they work on the data.
+        """
+        return self(value, out, workers)
+
+    def convert_iter(self, chunks):
+        """Generator converting each block yielded by 'chunks' in turn.
+
+        Only one block is held in memory at a time, so this works for
+        generators of numpy blocks, file readers and the like.  Blocks keep
+        their shape (they are not squeezed).
+        """
+        for chunk in chunks:
+            yield self._convert(chunk)
 
-    def _evaluate(self, value):
-        x = deepcopy(value)
-        expr = self.get_expression('x')
-        ret = ne.evaluate(expr)
+    def convert_chunked(self, array, chunk_size=CHUNK_SIZE, out=None):
+        """Convert 'array' block by block along its first axis.
 
-        ret = ret.squeeze()
-        if ret.size == 1:
-            if ret.ndim == 0:
-                ret = ret[()]
+        Each block holds roughly 'chunk_size' elements, which bounds the
+        working memory for memory-mapped or otherwise file-backed arrays.
+        'out' may itself be a memory-mapped array (or any object supporting
+        slice assignment); if omitted a new in-memory array is allocated.
+        Returns 'out'.
+        """
+        if out is None:
+            out = np.empty(array.shape, dtype=_result_dtype(array))
+        if out.shape != array.shape:
+            raise ValueError('\'out\' must have shape {0}, got {1}'.format(array.shape, out.shape))
+
+        if len(array.shape) == 0:
+            out[...] = self._convert(array)
+            return out
+
+        row_size = int(np.prod(array.shape[1:]))
+        rows = max(1, int(chunk_size) // max(row_size, 1))
+        for start in xrange(0, array.shape[0], rows):
+            block = slice(start, start + rows)
+            if isinstance(out, np.ndarray):
+                self._convert(np.asarray(array[block]), out[block])
             else:
-                ret = ret[0]
+                out[block] = self._convert(np.asarray(array[block]))
+
+        return out
+
+    def _convert_parallel(self, value, out, workers):
+        if out is None:
+            out = np.empty(value.shape, dtype=_result_dtype(value))
+
+        if value.flags.c_contiguous and out.flags.c_contiguous:
+            # Split the flattened views so that every worker gets an equal share
+            src, dst = value.reshape(-1), out.reshape(-1)
+        else:
+            src, dst = value, out
+
+        bounds = np.linspace(0, len(src), workers + 1).astype(int)
+        slices = [slice(start, stop) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+        _get_thread_pool(workers).map(lambda block: self._convert(src[block], dst[block]), slices)
+
+        return out
+
+    def _convert(self, value, out=None):
+        # Converts an array-like into 'out' (or a new array) without squeezing
+        if _is_native_array(value) and (out is None or _is_native_array(out, value.dtype)):
+            return self._convert_buffer(value, out)
+
+        return self._evaluate(value, out)
+
+    def _convert_buffer(self, value, out=None):
+        # C-contiguous float32/float64 arrays go straight to
+        # cv_convert_floats/cv_convert_doubles without any copies
+        ret = np.empty_like(value) if out is None else out
+        ut.cv_convert_buffer(self.this, value, ret)
+
+        return ret
+
+    def _convert_copy(self, value):
+        # Converts a private C-contiguous float64 copy of 'value' in place with
+        # the C converter, the same exact arithmetic as the buffer path
+        ret = np.array(value, dtype=np.double, order='C')
+        ut.cv_convert_buffer(self.this, ret, ret)
 
         return ret
 
+    def _evaluate(self, value, out=None):
+        coefficients = self.coefficients
+        if coefficients is not None:
+            return self._evaluate_affine(value, coefficients, out)
+
+        ret = self._convert_copy(value)
+
+        if out is not None:
+            out[...] = ret
+            return out
+
+        return ret.astype(_result_dtype(value), copy=False)
+
+    def _evaluate_affine(self, value, coefficients, out=None):
+        scale, offset = coefficients
+        if out is None:
+            # A fresh array we own, so the arithmetic can be done in place
+            x = ret = np.array(value, dtype=np.double)
+        else:
+            x = np.asarray(value, dtype=np.double)
+            ret = out
+
+        if scale != 1.0:
+            np.multiply(x, scale, out=ret)
+        elif ret is not x:
+            ret[...] = x
+        if offset != 0.0:
+            np.add(ret, offset, out=ret)
+
+        if out is None:
+            return ret.astype(_result_dtype(value), copy=False)
+
+        return ret
+
+    def __getstate__(self):
+        # Affine converters travel as their coefficients alone, anything else
+        # as the recipe it was built from (units, log base, power, ...)
+        coefficients = self.coefficients
+        if coefficients is None and self._spec is None:
+            raise TypeError('Converter \'{0}\' cannot be pickled'.format(self))
+        spec = self._spec if coefficients is None else None
+
+        return {'coefficients': coefficients, 'spec': spec, 'expression': self.get_expression('x')}
+
+    def __setstate__(self, state):
+        coefficients = state['coefficients']
+        if coefficients is not None:
+            other = Converter(scale=coefficients[0], offset=coefficients[1])
+        else:
+            other = _rebuild_converter(state['spec'])
+
+        self.this = other.this
+        self._coefficients = other._coefficients
+        self._spec = state['spec']
+
     def __repr__(self):
         return "<unit converter: %s>" % self.__str__()
 
     def __str__(self):
-        return "y = %s" % self.get_expression("x")
\ No newline at end of file
+        return "y = %s" % self.get_expression("x")
+
+def _rebuild_converter(spec):
+    kind, args = spec[0], spec[1:]
+    if kind == 'inverse':
+        return Converter(inverse=True)
+    elif kind == 'log':
+        return Converter(base=args[0])
+    elif kind == 'pow':
+        return Converter(power=args[0])
+    elif kind == 'units':
+        return Converter(*args)
+    elif kind == 'combine':
+        return args[0].combine(args[1])
+
+    raise ValueError('Unknown converter spec: {0}'.format(spec))
+
+def warm_caches(units=(), conversions=(), system=None):
+    """Parse 'units' and build the converters for the (from, to) pairs in
+    'conversions', filling the unit and converter caches.
+
+    Call it before creating a multiprocessing pool so that forked workers
+    start with the default system loaded and the caches warm, or pass it as
+    the pool's initializer (with the lists as initargs) when workers are
+    spawned rather than forked.  Avoid forking while other threads are
+    using the caches.  Returns the system used.
+    """
+    system = system or get_default_system()
+    for spec in units:
+        system.parse(spec)
+    for from_, to in conversions:
+        Unit(from_, system=system).get_converter(to)
+
+    return system
@@ -27,6 +27,45 @@ Copyright (C) UC Regents 2012
 
 %{
 #include <udunits.h>
+#include <pythread.h>
+
+// Serializes the calls into the udunits library: ut_parse() and
+// ut_read_xml() are not reentrant and nearly every call sets the
+// process-wide ut_get_status().  The slow calls (the *_status variants of
+// parse, read_xml and get_converter) hold it with the GIL released; all
+// the others hold it together with the GIL.
+static PyThread_type_lock _ut_lock = NULL;
+
+#ifdef HAVE_FORK
+#include <pthread.h>
+
+// A child forked while another thread held _ut_lock (with the GIL released,
+// e.g. in ut_read_xml()) would never see it released: give it a new one.
+// The old lock is leaked, freeing a held lock is undefined.
+static void _ut_atfork_child(void)
+{
+    _ut_lock = PyThread_allocate_lock();
+}
+#endif
+
+// Take _ut_lock without blocking other Python threads while waiting for it
+static void _ut_acquire(void)
+{
+    if (!PyThread_acquire_lock(_ut_lock, NOWAIT_LOCK)) {
+        Py_BEGIN_ALLOW_THREADS
+        PyThread_acquire_lock(_ut_lock, WAIT_LOCK);
+        Py_END_ALLOW_THREADS
+    }
+}
+
+// Run 'call' holding _ut_lock but not the GIL; 'call' must not touch any
+// Python object
+#define UT_CALL_WITHOUT_GIL(call)                   \
+    Py_BEGIN_ALLOW_THREADS                          \
+    PyThread_acquire_lock(_ut_lock, WAIT_LOCK);     \
+    call;                                           \
+    PyThread_release_lock(_ut_lock);                \
+    Py_END_ALLOW_THREADS
 %}
 
 %include cstring.i
@@ -64,16 +103,26 @@ Copyright (C) UC Regents 2012
 %newobject ut_scale;
 
 // udunits2.h
+%exception {
+    _ut_acquire();
+    $action
+    PyThread_release_lock(_ut_lock);
+}
+
 %cstring_output_maxsize(char* buffer, size_t buffer_size);
 int ut_format(const ut_unit* const unit, char* buffer, size_t buffer_size, unsigned opts);
+%exception;
 
 // Pretend that ut_unit and ut_system are empty: SWIG refuses to extend a
 // struct or a union with an incomplete type. :-(
 typedef union ut_unit {} ut_unit;
-%extend ut_unit { ~ut_unit() { ut_free($self); } };
+// The destructors run from Python GC outside the %exception blocks, so
+// they take _ut_lock themselves: ut_free_system() updates udunits' global
+// system maps, which the GIL-less calls below read.
+%extend ut_unit { ~ut_unit() { _ut_acquire(); ut_free($self); PyThread_release_lock(_ut_lock); } };
 
 typedef struct ut_system {} ut_system;
-%extend ut_system { ~ut_system() { ut_free_system($self); } };
+%extend ut_system { ~ut_system() { _ut_acquire(); ut_free_system($self); PyThread_release_lock(_ut_lock); } };
 
 %ignore ut_write_to_stderr;
 %ignore ut_error_message_handler;
@@ -87,7 +136,13 @@ typedef struct ut_system {} ut_system;
 %ignore ut_system;
 %ignore ut_free;
 %ignore ut_free_system;
+%exception {
+    _ut_acquire();
+    $action
+    PyThread_release_lock(_ut_lock);
+}
 %include <udunits2.h>
+%exception;
 
  // converter.h
 
@@ -102,8 +157,11 @@ typedef struct ut_system {} ut_system;
 
 // See the comment about ut_unit and ut_system above.
 typedef union cv_converter {} cv_converter;
-%extend cv_converter { ~cv_converter() { cv_free($self); } };
+%extend cv_converter { ~cv_converter() { _ut_acquire(); cv_free($self); PyThread_release_lock(_ut_lock); } };
 
+// The cv_*() calls only touch the converter they are given and don't need
+// _ut_lock.  cv_convert_double() keeps the GIL: it takes a few nanoseconds,
+// less than handing the GIL over; cv_convert_buffer() below releases it.
 %cstring_output_maxsize(char* const buffer, size_t buffer_size);
 int cv_get_expression(const cv_converter* const conv, char* const buffer, size_t buffer_size,
                       const char* const variable);
@@ -112,9 +170,181 @@ int cv_get_expression(const cv_converter* const conv, char* const buffer, size_t
 %ignore cv_converter;
 %ignore cv_convert_float;
 %ignore cv_convert_floats;
+%ignore cv_convert_doubles;
 %ignore cv_get_expression;
 %include <converter.h>
 
+// Bulk conversion of buffer-protocol objects (e.g. numpy arrays).  Both
+// buffers must be C-contiguous, hold the same number of float32 ('f') or
+// float64 ('d') items and 'out' must be writable.  'in' and 'out' may be the
+// same object for in-place conversion.
+%{
+static int _cv_buffer_typecode(Py_buffer* view)
+{
+    const char* format = view->format ? view->format : "B";
+    size_t len = strlen(format);
+    char code = len ? format[len - 1] : 'B';
+
+    if (code == 'd' && view->itemsize == sizeof(double))
+        return 'd';
+    if (code == 'f' && view->itemsize == sizeof(float))
+        return 'f';
+    return 0;
+}
+%}
+
+%inline %{
+PyObject* cv_convert_buffer(const cv_converter* const converter, PyObject* in, PyObject* out)
+{
+    Py_buffer in_view, out_view;
+    int code;
+    size_t count;
+
+    if (PyObject_GetBuffer(in, &in_view, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) < 0)
+        return NULL;
+    if (PyObject_GetBuffer(out, &out_view, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT | PyBUF_WRITABLE) < 0) {
+        PyBuffer_Release(&in_view);
+        return NULL;
+    }
+
+    code = _cv_buffer_typecode(&in_view);
+    if (!code || code != _cv_buffer_typecode(&out_view)) {
+        PyErr_SetString(PyExc_TypeError, "'in' and 'out' must both be float32 or both be float64 buffers");
+        goto fail;
+    }
+    if (in_view.len != out_view.len) {
+        PyErr_SetString(PyExc_ValueError, "'in' and 'out' must have the same number of items");
+        goto fail;
+    }
+
+    // The conversion only touches the two buffers, which stay locked until
+    // they are released below, so other threads may run in the meantime
+    count = (size_t)(in_view.len / in_view.itemsize);
+    Py_BEGIN_ALLOW_THREADS
+    if (code == 'd')
+        cv_convert_doubles(converter, (const double*)in_view.buf, count, (double*)out_view.buf);
+    else
+        cv_convert_floats(converter, (const float*)in_view.buf, count, (float*)out_view.buf);
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&in_view);
+    PyBuffer_Release(&out_view);
+    Py_RETURN_NONE;
+
+fail:
+    PyBuffer_Release(&in_view);
+    PyBuffer_Release(&out_view);
+    return NULL;
+}
+%}
+
+// Status-returning variants of the calls whose failures are reported
+// through ut_get_status().  The status is a process-wide global in udunits,
+// so reading it with a separate get_status() call after the fact can pick
+// up another thread's status.  These read it inside the same wrapper call,
+// under _ut_lock, and return [result, status].  read_xml, parse and
+// get_converter release the GIL for the duration of the call.
+%newobject ut_read_xml_status;
+%newobject ut_new_system_status;
+%newobject ut_parse_status;
+%newobject ut_get_converter_status;
+%newobject ut_get_unit_by_name_status;
+%newobject ut_get_unit_by_symbol_status;
+%newobject ut_new_base_unit_status;
+%newobject ut_new_dimensionless_unit_status;
+%newobject ut_get_dimensionless_unit_one_status;
+%newobject ut_offset_by_time_status;
+
+%inline %{
+ut_system* ut_read_xml_status(const char* path, int* status)
+{
+    ut_system* result;
+    UT_CALL_WITHOUT_GIL(result = ut_read_xml(path); *status = ut_get_status())
+    return result;
+}
+
+ut_system* ut_new_system_status(int* status)
+{
+    _ut_acquire();
+    ut_system* result = ut_new_system();
+    *status = ut_get_status();
+    PyThread_release_lock(_ut_lock);
+    return result;
+}
+
+ut_unit* ut_parse_status(const ut_system* const system, const char* const string, ut_encoding encoding, int* status)
+{
+    ut_unit* result;
+    UT_CALL_WITHOUT_GIL(result = ut_parse(system, string, encoding); *status = ut_get_status())
+    return result;
+}
+
+cv_converter* ut_get_converter_status(ut_unit* const from, ut_unit* const to, int* status)
+{
+    cv_converter* result;
+    UT_CALL_WITHOUT_GIL(result = ut_get_converter(from, to); *status = ut_get_status())
+    return result;
+}
+
+ut_unit* ut_get_unit_by_name_status(const ut_system* const system, const char* const name, int* status)
+{
+    _ut_acquire();
+    ut_unit* result = ut_get_unit_by_name(system, name);
+    *status = ut_get_status();
+    PyThread_release_lock(_ut_lock);
+    return result;
+}
+
+ut_unit* ut_get_unit_by_symbol_status(const ut_system* const system, const char* const symbol, int* status)
+{
+    _ut_acquire();
+    ut_unit* result = ut_get_unit_by_symbol(system, symbol);
+    *status = ut_get_status();
+    PyThread_release_lock(_ut_lock);
+    return result;
+}
+
+ut_unit* ut_new_base_unit_status(ut_system* const system, int* status)
+{
+    _ut_acquire();
+    ut_unit* result = ut_new_base_unit(system);
+    *status = ut_get_status();
+    PyThread_release_lock(_ut_lock);
+    return result;
+}
+
+ut_unit* ut_new_dimensionless_unit_status(ut_system* const system, int* status)
+{
+    _ut_acquire();
+    ut_unit* result = ut_new_dimensionless_unit(system);
+    *status = ut_get_status();
+    PyThread_release_lock(_ut_lock);
+    return result;
+}
+
+ut_unit* ut_get_dimensionless_unit_one_status(const ut_system* const system, int* status)
+{
+    _ut_acquire();
+    ut_unit* result = ut_get_dimensionless_unit_one(system);
+    *status = ut_get_status();
+    PyThread_release_lock(_ut_lock);
+    return result;
+}
+
+ut_unit* ut_offset_by_time_status(const ut_unit* const unit, const double origin, int* status)
+{
+    _ut_acquire();
+    ut_unit* result = ut_offset_by_time(unit, origin);
+    *status = ut_get_status();
+    PyThread_release_lock(_ut_lock);
+    return result;
+}
+%}
+
 %init %{
+	_ut_lock = PyThread_allocate_lock();
+#ifdef HAVE_FORK
+	pthread_atfork(NULL, NULL, _ut_atfork_child);
+#endif
 	ut_set_error_message_handler(ut_ignore);
 %}
\ No newline at end of file